@@ -0,0 +1,89 @@
+################################################################################
+# Copyright (C) 2016, 2017
+# Younghyung Cho. <yhcting77@gmail.com>
+# All rights reserved.
+#
+# This file is part of cfgldr in ypylib
+#
+# This program is licensed under the FreeBSD license
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+# The views and conclusions contained in the software and documentation
+# are those of the authors and should not be interpreted as representing
+# official policies, either expressed or implied, of the FreeBSD Project.
+################################################################################
+
+
+#
+# Command line interface.
+#
+#   python -m cfgldr compile [-v verifier] [-e engine] -o output config
+#
+from __future__ import print_function
+import os.path
+import sys
+import argparse
+
+# Modules of this package import each other by top-level name.
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import parser
+import loader
+from errors import BaseError
+
+
+def _compile(args):
+    loader.compile_config(args.config, args.verifier, args.output,
+                          engine=args.engine)
+
+
+def main(argv):
+    ap = argparse.ArgumentParser(prog='cfgldr')
+    subs = ap.add_subparsers(dest='command')
+    sp = subs.add_parser('compile',
+                         help='Write evaluated and verified config to'
+                              ' compiled config file')
+    sp.add_argument('-v', '--verifier', default=None,
+                    help='verifier file')
+    sp.add_argument('-e', '--engine', default=parser.ENGINE_PYPARSING,
+                    choices=(parser.ENGINE_PYPARSING, parser.ENGINE_LINE),
+                    help='parsing engine')
+    sp.add_argument('-o', '--output', required=True,
+                    help='compiled config file')
+    sp.add_argument('config', help='config file')
+    sp.set_defaults(func=_compile)
+    args = ap.parse_args(argv)
+    if None is getattr(args, 'func', None):
+        ap.print_usage()
+        return 2
+    try:
+        args.func(args)
+    except (BaseError, IOError, OSError) as e:
+        print(str(e), file=sys.stderr)
+        return 1
+    return 0
+
+
+if '__main__' == __name__:
+    sys.exit(main(sys.argv[1:]))
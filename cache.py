@@ -0,0 +1,204 @@
+################################################################################
+# Copyright (C) 2016, 2017
+# Younghyung Cho. <yhcting77@gmail.com>
+# All rights reserved.
+#
+# This file is part of cfgldr in ypylib
+#
+# This program is licensed under the FreeBSD license
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+# The views and conclusions contained in the software and documentation
+# are those of the authors and should not be interpreted as representing
+# official policies, either expressed or implied, of the FreeBSD Project.
+################################################################################
+
+
+#
+# On-disk cache of loaded config.
+#
+# Cache entry is keyed by paths of config/verifier files and dictionaries
+# used to load config. Entry is valid only if contents of all files read
+# while loading config (including ones pulled in by 'include'-like commands)
+# are not changed.
+#
+from __future__ import print_function
+import os
+import os.path
+import tempfile
+import hashlib
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+import logger
+from deps import dict_key
+from verifier import Verifier
+
+P = logger.P(__name__)
+P.set_level(P.ERROR)
+
+
+# Update this whenever pickled data format is changed.
+_CACHE_VERSION = 9
+_CACHE_FILE_EXT = '.cache'
+
+
+def _ruledict_key(d):
+    """Functions cannot be compared by value. So, use it's name."""
+    if None is d:
+        return None
+    return sorted([(k, '%s.%s' % (getattr(d[k], '__module__', ''),
+                                  getattr(d[k], '__name__', repr(d[k]))))
+                   for k in d])
+
+
+def make_key(fconf, fverifier, confdict, vrfdict, vrf_ruledict,
+             track_provenance=True):
+    """
+    :return: (str) cache key for given arguments of 'load_config'.
+    """
+    fconf = os.path.abspath(fconf)
+    if isinstance(fverifier, Verifier):
+        # Contents of verifier files are not checked when cache is loaded.
+        # So, they should be part of key.
+        vdeps = fverifier.deps
+        fverifier = (fverifier.file,
+                     None if None is vdeps else sorted(vdeps.files.items()),
+                     _ruledict_key(fverifier.ruledict))
+        vrfdict = vrf_ruledict = None
+    elif None is not fverifier:
+        fverifier = os.path.abspath(fverifier)
+    keysrc = repr((_CACHE_VERSION,
+                   fconf,
+                   fverifier,
+                   dict_key(confdict),
+                   dict_key(vrfdict),
+                   _ruledict_key(vrf_ruledict),
+                   track_provenance))
+    return hashlib.sha1(keysrc.encode('utf-8')).hexdigest()
+
+
+def _cache_file(cachedir, key):
+    return os.path.join(cachedir, key + _CACHE_FILE_EXT)
+
+
+def load(cachedir, key):
+    """
+    :param cachedir: (str) cache directory
+    :param key: (str) cache key from 'make_key'
+    :return: (section.Sect) cached root section. None if there is no valid
+             cache entry.
+    """
+    try:
+        with open(_cache_file(cachedir, key), 'rb') as f:
+            deps = pickle.load(f)
+            if not deps.is_uptodate():
+                return None
+            return pickle.load(f)
+    except IOError:
+        return None
+    except Exception as e:
+        # Broken cache entry is regarded as 'no entry'
+        P.w('Fail to load cache(%s): %s' % (key, str(e)))
+        return None
+
+
+def store(cachedir, key, deps, sroot):
+    """
+    Store loaded config to cache. Failure of storing is ignored.
+    :param cachedir: (str) cache directory
+    :param key: (str) cache key from 'make_key'
+    :param deps: (deps.Deps) files read while loading config.
+    :param sroot: (section.Sect) root section of loaded config
+    """
+    tmpf = None
+    try:
+        if not os.path.isdir(cachedir):
+            os.makedirs(cachedir)
+        fd, tmpf = tempfile.mkstemp(dir=cachedir)
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump(deps, f, pickle.HIGHEST_PROTOCOL)
+            pickle.dump(sroot, f, pickle.HIGHEST_PROTOCOL)
+        # Replace existing one atomically.
+        os.rename(tmpf, _cache_file(cachedir, key))
+        tmpf = None
+    except (IOError, OSError) as e:
+        P.w('Fail to store cache(%s): %s' % (key, str(e)))
+    finally:
+        if None is not tmpf and os.path.exists(tmpf):
+            os.remove(tmpf)
+
+
+# ============================================================================
+#
+#
+#
+# ============================================================================
+def test():
+    import shutil
+    import loader
+
+    tmpd = tempfile.mkdtemp()
+    try:
+        cachedir = os.path.join(tmpd, 'cache')
+        fconf = os.path.join(tmpd, 'conf')
+        finc = os.path.join(tmpd, 'inc')
+        with open(fconf, 'w') as f:
+            f.write('@include (inc)\nkey0 = {*key1}\n')
+        with open(finc, 'w') as f:
+            f.write('key1 = value1\n')
+
+        s0 = loader.load_config(fconf, None, cachedir=cachedir)
+        s1 = loader.load_config(fconf, None, cachedir=cachedir)
+        assert str(s0) == str(s1)
+        assert s1['key0'] == 'value1'
+
+        # Changing included file invalidates cache.
+        with open(finc, 'w') as f:
+            f.write('key1 = value2\n')
+        s2 = loader.load_config(fconf, None, cachedir=cachedir)
+        assert s2['key0'] == 'value2'
+
+        # Different named-replacement dictionary uses different entry.
+        with open(fconf, 'w') as f:
+            f.write('key0 = %(v)s\n')
+        s3 = loader.load_config(fconf, None, {'v': 'a'}, cachedir=cachedir)
+        s4 = loader.load_config(fconf, None, {'v': 'b'}, cachedir=cachedir)
+        assert 'a' == s3['key0'] and 'b' == s4['key0']
+
+        # Broken cache entry is ignored.
+        key = make_key(fconf, None, {'v': 'a'}, None, None)
+        with open(_cache_file(cachedir, key), 'wb') as f:
+            f.write(b'broken')
+        assert None is load(cachedir, key)
+        s5 = loader.load_config(fconf, None, {'v': 'a'}, cachedir=cachedir)
+        assert 'a' == s5['key0']
+    finally:
+        shutil.rmtree(tmpd)
+
+
+if '__main__' == __name__:
+    test()
@@ -35,8 +35,19 @@
 ################################################################################
 
 
+import sys
+try:
+    from collections.abc import KeysView, ValuesView, ItemsView
+except ImportError:
+    from collections import KeysView, ValuesView, ItemsView  # python2
+import collections
+
+
 _UNIQ_DUMMY_OBJ = object()
 
+# Built-in dict keeps insertion order since python 3.7.
+_DICT_ORDERED = sys.version_info >= (3, 7)
+
 
 def __newobj__(cls, *args):
     # Hack for pickle
@@ -44,30 +55,63 @@ def __newobj__(cls, *args):
 
 
 class OrderedDict(dict):
+    """
+    Dictionary keeping insertion order of keys. Overwriting value of
+    existing key doesn't change the order.
+    Key order is the one of built-in dict if it keeps insertion order.
+    Otherwise, separated ordered key set is used.
+    """
     def __setstate__(self, state):
         dict.update(self, state[0])
         self.__dict__.update(state[1])
 
     def __reduce__(self):
-        state = (dict(self), self.__dict__)
+        state = (dict.copy(self), self.__dict__)
         return __newobj__, (self.__class__,), state
 
     def __getitem__(self, k):
         return dict.__getitem__(self, k)
 
-    def __setitem__(self, k, v):
-        if k not in self:
-            self.ks.append(k)
-        dict.__setitem__(self, k, v)
+    if _DICT_ORDERED:
+        def __init__(self):
+            # noinspection PyTypeChecker
+            dict.__init__(self)
+
+        def keys(self):
+            return dict.keys(self)
+
+        def clear(self):
+            dict.clear(self)
+    else:
+        def __init__(self):
+            # noinspection PyTypeChecker
+            dict.__init__(self)
+            # Ordered key set - sequence of key values (including
+            # subsection name)
+            self._ks = collections.OrderedDict()
+
+        def __setitem__(self, k, v):
+            if k not in self:
+                self._ks[k] = None
+            dict.__setitem__(self, k, v)
+
+        def __delitem__(self, k):
+            dict.__delitem__(self, k)
+            del self._ks[k]
 
-    def __delitem__(self, k):
-        dict.__delitem__(self, k)
-        if k in self.ks:
-            self.ks.remove(k)
+        def __iter__(self):
+            return iter(self._ks)
+
+        def keys(self):
+            return KeysView(self)
+
+        def clear(self):
+            dict.clear(self)
+            self._ks.clear()
 
     def __repr__(self):
         return '{%s}' % ', '.join([('%s: %s' % (repr(k), repr(self[k])))
-                                   for k in self.ks])
+                                   for k in self])
 
     __str__ = __repr__
     __str__.__doc__ = "x.__str__() <==> str(x)"
@@ -75,18 +119,12 @@ class OrderedDict(dict):
     def __eq__(self, y):
         """Order of key should be same too."""
         return isinstance(y, self.__class__) \
-            and self.ks == y.ks \
-            and dict.__eq__(self, y)
+            and dict.__eq__(self, y) \
+            and list(self) == list(y)
 
     def __ne__(self, y):
         return not self.__eq__(y)
 
-    def __init__(self):
-        # noinspection PyTypeChecker
-        dict.__init__(self)
-        # sequence(order) of key values (including subsection name)
-        self.ks = []  # key sequence
-
     def get(self, k, d=None):
         try:
             return self[k]
@@ -121,17 +159,13 @@ class OrderedDict(dict):
         return v
 
     def popitem(self):
-        if not self.ks:
+        if 0 == len(self):
             raise KeyError(": 'popitem(): dictionary is empty'")
-        k = self.ks[0]
+        k = next(iter(self))
         v = self[k]
         del self[k]
         return k, v
 
-    def clear(self):
-        dict.clear(self)
-        self.ks = []
-
     def setdefault(self, k, d=None):
         try:
             return self[k]
@@ -139,23 +173,19 @@ class OrderedDict(dict):
             self[k] = d
             return self[k]
 
+    # Views are used not to copy keys and values.
     def items(self):
-        return zip(self.ks, self.values())
-
-    def keys(self):
-        return self.ks
+        return ItemsView(self)
 
     # noinspection PyMethodOverriding
     def values(self):
-        return [self[k] for k in self.ks]
+        return ValuesView(self)
 
     def iteritems(self):
         return iter(self.items())
 
     def iterkeys(self):
-        return iter(self.ks)
-
-    __iter__ = iterkeys
+        return iter(self)
 
     def itervalues(self):
         return iter(self.values())
@@ -170,6 +200,23 @@ def test():
     od = OrderedDict()
     od['a'] = 'A'
     assert None is od.pop('b', None)
+    od['b'] = 'B'
+    od['c'] = 'C'
+    del od['a']
+    od['a'] = 'AA'
+    od['b'] = 'BB'
+    assert ['b', 'c', 'a'] == list(od.keys())
+    assert ['BB', 'C', 'AA'] == list(od.values())
+    assert [('b', 'BB'), ('c', 'C'), ('a', 'AA')] == list(od.items())
+    assert ('b', 'BB') == od.popitem()
+    od2 = OrderedDict()
+    od2['a'] = 'AA'
+    od2['c'] = 'C'
+    assert od != od2
+    od2.clear()
+    assert 0 == len(od2) and [] == list(od2)
+    import pickle
+    assert od == pickle.loads(pickle.dumps(od, pickle.HIGHEST_PROTOCOL))
 
 if '__main__' == __name__:
     test()
@@ -0,0 +1,151 @@
+################################################################################
+# Copyright (C) 2016, 2017
+# Younghyung Cho. <yhcting77@gmail.com>
+# All rights reserved.
+#
+# This file is part of cfgldr in ypylib
+#
+# This program is licensed under the FreeBSD license
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+# The views and conclusions contained in the software and documentation
+# are those of the authors and should not be interpreted as representing
+# official policies, either expressed or implied, of the FreeBSD Project.
+################################################################################
+
+
+#
+# Tracking files that a parse result depends on.
+#
+import os
+import os.path
+import glob
+import hashlib
+import time
+
+
+# File modified within this period(sec.) before being read may be modified
+# again without changing it's mtime. So, it's stat is not trusted.
+_RACY_PERIOD = 2
+
+
+def glob_files(pattern):
+    """
+    Expand glob pattern used as argument of 'include'-like commands.
+    Directories are ignored.
+    :param pattern: (str) glob pattern (abs-path)
+    :return: list(str) sorted list of matched files.
+    """
+    return sorted([f for f in glob.glob(pattern) if os.path.isfile(f)])
+
+
+def dict_key(d):
+    """
+    :param d: (dict) dictionary like named-replacement-dict.
+    :return: (str) comparable key of dictionary values.
+    """
+    if None is d:
+        return None
+    return repr(sorted([(k, repr(d[k])) for k in d]))
+
+
+def digest(content):
+    """
+    :param content: (bytes) file content
+    :return: (str) digest of content
+    """
+    return hashlib.sha1(content).hexdigest()
+
+
+def _stat(fpath):
+    """
+    :return: tuple(mtime, size) of file. None if file is not accessible or
+             it's stat cannot be trusted.
+    """
+    try:
+        st = os.stat(fpath)
+    except OSError:
+        return None
+    if time.time() - st.st_mtime < _RACY_PERIOD:
+        return None
+    return (st.st_mtime, st.st_size)
+
+
+class Deps(object):
+    """
+    Files (and glob expansions) read while parsing config.
+    Parse result is still valid if none of them are changed.
+    """
+    def __init__(self):
+        self.files = {}  # abs-path -> digest of content
+        self.stats = {}  # abs-path -> (mtime, size) when file is read
+        self.globs = {}  # glob pattern -> list of matched files
+
+    def add_file(self, fpath, content):
+        """
+        :param fpath: (str) abs-path of file
+        :param content: (bytes) file content read while parsing
+        """
+        self.files[fpath] = digest(content)
+        self.stats[fpath] = _stat(fpath)
+
+    def add_glob(self, pattern, files):
+        """
+        :param pattern: (str) glob pattern
+        :param files: list(str) files matched with pattern
+        """
+        self.globs[pattern] = sorted(files)
+
+    def update(self, other):
+        self.files.update(other.files)
+        self.stats.update(other.stats)
+        self.globs.update(other.globs)
+
+    def _is_file_uptodate(self, f):
+        st = self.stats.get(f)
+        if (None is not st
+                and st == _stat(f)):
+            # Content is not read if mtime and size are not changed.
+            return True
+        try:
+            with open(f, 'rb') as fh:
+                if digest(fh.read()) != self.files[f]:
+                    return False
+        except IOError:
+            return False
+        # Only mtime is changed(ex. 'touch').
+        self.stats[f] = _stat(f)
+        return True
+
+    def is_uptodate(self):
+        """
+        :return: (bool) True if none of files and globs are changed.
+        """
+        for pattern, files in self.globs.items():
+            if glob_files(pattern) != files:
+                return False
+        for f in self.files:
+            if not self._is_file_uptodate(f):
+                return False
+        return True
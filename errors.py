@@ -41,11 +41,16 @@
 #
 # ============================================================================
 class BaseError(Exception):
-    """Top-most base error"""
+    """
+    Top-most base error
+    Sub classes should pass arguments of '__init__' to this, to be pickled
+    - ex. errors raised at process pool.
+    """
 
 
 class ParseBaseError(BaseError):
     def __init__(self, pi):
+        BaseError.__init__(self, pi)
         self.pi = pi
 
     def __str__(self):
@@ -60,6 +65,10 @@ class FileIOError(ParseBaseError):
     """Config file IO error."""
 
 
+class CancelledError(BaseError):
+    """Loading is cancelled."""
+
+
 class VerificationError(BaseError):
     """Verification fails"""
     def __init__(self, ckey, cpih, vkey, vpih, msg=''):
@@ -70,6 +79,7 @@ class VerificationError(BaseError):
         :param vpih: (ParseInfoHistory) verifier parse info
         :param msg: (str) title message
         """
+        BaseError.__init__(self, ckey, cpih, vkey, vpih, msg)
         self.ckey = ckey
         self.cpih = cpih
         self.vkey = vkey
@@ -96,6 +106,7 @@ class EvalError(BaseError):
         :param evh: list(str) evaluation history
         :param ref: (str) reference path
         """
+        BaseError.__init__(self, pih, evh, ref)
         self.pih = pih
         self.evh = evh
         self.ref = ref
@@ -109,6 +120,7 @@ Reference key: %s''' % (str(self.pih), '->'.join(self.evh), self.ref)
 
 class VerificationFailException(BaseError):
     def __init__(self, msg):
+        BaseError.__init__(self, msg)
         self.msg = msg
 
     def __str__(self):
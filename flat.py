@@ -0,0 +1,506 @@
+################################################################################
+# Copyright (C) 2016, 2017
+# Younghyung Cho. <yhcting77@gmail.com>
+# All rights reserved.
+#
+# This file is part of cfgldr in ypylib
+#
+# This program is licensed under the FreeBSD license
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+# The views and conclusions contained in the software and documentation
+# are those of the authors and should not be interpreted as representing
+# official policies, either expressed or implied, of the FreeBSD Project.
+################################################################################
+
+
+#
+# Flat, offset-based binary layout of loaded config.
+#
+# Evaluated section tree is written to one contiguous buffer once. Readers
+# access keys through read-only 'SectView' directly on the buffer - ex.
+# shared memory block or mmap-ed compiled config file - without
+# deserializing whole tree.
+#
+# Layout (little endian, all offsets are from start of buffer):
+#   header : magic(4s) version(u32) root-section-offset(u32)
+#   string : length(u32) utf-8 bytes
+#   object : length(u32) pickled bytes
+#   section: name-string-offset(u32, _NONE for None) number-of-keys(u32)
+#            entries - key-string-offset(u32) value-offset(u32)
+#                      value-type(u8) key-info-flags(u8) padding(2)
+#            entry indexes sorted by key bytes(u32 * number-of-keys)
+#   Entries are in key order of section.
+#
+from __future__ import print_function
+import os
+import os.path
+import mmap
+import tempfile
+import struct
+import uuid
+try:
+    from collections.abc import KeysView, ValuesView, ItemsView
+except ImportError:
+    from collections import KeysView, ValuesView, ItemsView  # python2
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+from section import Sect, KP_DELIMITER
+from parseinfo import ParseInfoHistory
+
+_MAGIC = b'CFGF'
+# Update this whenever layout is changed.
+_VERSION = 1
+_HEADER = struct.Struct('<4sII')
+_U32 = struct.Struct('<I')
+_SECT = struct.Struct('<II')
+_ENTRY = struct.Struct('<IIBBxx')
+_NONE = 0xffffffff
+
+# Value types
+_VSECT = 0
+_VSTR = 1
+_VOBJ = 2  # pickled object
+
+_NOKEY = object()
+
+
+if bytes is str:  # python2
+    def _encode(s):
+        return s
+
+    def _decode(b):
+        return b
+else:
+    def _encode(s):
+        return s.encode('utf-8')
+
+    def _decode(b):
+        return b.decode('utf-8')
+
+
+class _Writer(object):
+    def __init__(self):
+        self.chunks = [b'\0' * _HEADER.size]
+        self.size = _HEADER.size
+        # str -> offset. Same strings are written only once.
+        self.strs = {}
+
+    def _append(self, b):
+        off = self.size
+        self.chunks.append(b)
+        self.size += len(b)
+        return off
+
+    def _blob(self, b):
+        return self._append(_U32.pack(len(b)) + b)
+
+    def string(self, s):
+        off = self.strs.get(s)
+        if None is off:
+            off = self._blob(_encode(s))
+            self.strs[s] = off
+        return off
+
+    def sect(self, s):
+        """
+        Children are written before parent. So, section record is written
+        at once.
+        :return: (int) offset of section record
+        """
+        ents = []
+        for k in s:
+            v = s[k]  # LazyValue is evaluated here.
+            if isinstance(v, Sect):
+                vt, voff = _VSECT, self.sect(v)
+            elif isinstance(v, str):
+                vt, voff = _VSTR, self.string(v)
+            else:
+                vt, voff = _VOBJ, self._blob(
+                    pickle.dumps(v, pickle.HIGHEST_PROTOCOL))
+            # noinspection PyProtectedMember
+            ents.append((_encode(k), self.string(k), voff, vt, s._ki[k]))
+        idxs = sorted(range(len(ents)), key=lambda i: ents[i][0])
+        rec = [_SECT.pack(_NONE if None is s.name else self.string(s.name),
+                          len(ents))]
+        rec.extend([_ENTRY.pack(*e[1:]) for e in ents])
+        rec.extend([_U32.pack(i) for i in idxs])
+        return self._append(b''.join(rec))
+
+
+def dumps(sroot):
+    """
+    Serialize section tree to flat layout. LazyValues are evaluated.
+    Parse info history of keys is not stored.
+    :param sroot: (section.Sect) root section
+    :return: (bytes)
+    """
+    w = _Writer()
+    root = w.sect(sroot)
+    w.chunks[0] = _HEADER.pack(_MAGIC, _VERSION, root)
+    return b''.join(w.chunks)
+
+
+def view(buf):
+    """
+    :param buf: (bytes, mmap, memoryview or any buffer) buffer having data
+                from 'dumps'. It should be alive while view is used.
+    :return: (SectView) read-only view of root section
+    """
+    if len(buf) < _HEADER.size:
+        raise ValueError('Invalid flat config: too small')
+    magic, ver, root = _HEADER.unpack_from(buf, 0)
+    if _MAGIC != magic or _VERSION != ver:
+        raise ValueError('Invalid flat config: magic(%s) version(%d)'
+                         % (repr(magic), ver))
+    return SectView(buf, root)
+
+
+def _read_blob(buf, off):
+    n = _U32.unpack_from(buf, off)[0]
+    off += _U32.size
+    return bytes(buf[off:off + n])
+
+
+class SectView(object):
+    """
+    Read-only view of section in flat layout. Key values are read from
+    buffer whenever they are accessed. Interface for reading is same with
+    section.Sect. Parse info history of key is always empty.
+    """
+    __slots__ = ('_buf', '_off', '_n', 'name')
+
+    def __init__(self, buf, off):
+        """
+        :param buf: buffer. See 'view'.
+        :param off: (int) offset of section record
+        """
+        self._buf = buf
+        self._off = off
+        name, self._n = _SECT.unpack_from(buf, off)
+        self.name = None if _NONE == name else _decode(_read_blob(buf, name))
+
+    def _entry(self, i):
+        return _ENTRY.unpack_from(self._buf,
+                                  self._off + _SECT.size + i * _ENTRY.size)
+
+    def _find(self, k):
+        return SectView._find_at(self._buf, self._off, k)
+
+    @staticmethod
+    def _find_at(buf, off, k):
+        """
+        Binary search on sorted entry indexes of section record at 'off'.
+        :return: entry. None if there is no key.
+        """
+        kb = _encode(k)
+        n = _SECT.unpack_from(buf, off)[1]
+        entoff = off + _SECT.size
+        idxoff = entoff + n * _ENTRY.size
+        lo, hi = 0, n
+        while lo < hi:
+            mid = (lo + hi) // 2
+            i = _U32.unpack_from(buf, idxoff + mid * _U32.size)[0]
+            e = _ENTRY.unpack_from(buf, entoff + i * _ENTRY.size)
+            mk = _read_blob(buf, e[0])
+            if mk == kb:
+                return e
+            if mk < kb:
+                lo = mid + 1
+            else:
+                hi = mid
+        return None
+
+    def _value(self, e):
+        vt = e[2]
+        if _VSECT == vt:
+            return SectView(self._buf, e[1])
+        b = _read_blob(self._buf, e[1])
+        return _decode(b) if _VSTR == vt else pickle.loads(b)
+
+    def __len__(self):
+        return self._n
+
+    def __iter__(self):
+        for i in range(self._n):
+            yield _decode(_read_blob(self._buf, self._entry(i)[0]))
+
+    def __contains__(self, k):
+        return None is not self._find(k)
+
+    def __getitem__(self, k):
+        e = self._find(k)
+        if None is e:
+            raise KeyError(k)
+        return self._value(e)
+
+    get_raw = __getitem__
+
+    def get(self, k, d=None):
+        e = self._find(k)
+        return d if None is e else self._value(e)
+
+    def get_path(self, kpath, d=_NOKEY):
+        """
+        Only sections in key path are visited.
+        :param kpath: (str) key path relative to this section. ex. 'a:b:c'
+        :param d: default value if there is no key. KeyError is raised if
+                  it is not given. See section.Sect.get_path().
+        :return: key value
+        """
+        off = self._off
+        e = None
+        for k in kpath.split(KP_DELIMITER):
+            if None is not e:
+                if _VSECT != e[2]:
+                    e = None
+                    break
+                off = e[1]
+            e = SectView._find_at(self._buf, off, k)
+            if None is e:
+                break
+        if None is e:
+            if d is _NOKEY:
+                raise KeyError(kpath)
+            return d
+        return self._value(e)
+
+    def __repr__(self):
+        return '{%s}' % ', '.join([('%s: %s' % (repr(k), repr(v)))
+                                   for k, v in self.items()])
+
+    __str__ = __repr__
+
+    def keys(self):
+        return KeysView(self)
+
+    def values(self):
+        return ValuesView(self)
+
+    def items(self):
+        return ItemsView(self)
+
+    def is_section(self, k):
+        e = self._find(k)
+        return None is not e and _VSECT == e[2]
+
+    def is_readonly(self, k):
+        return k in self
+
+    def is_ki_set(self, k, attr):
+        e = self._find(k)
+        return None is not e and 0 != e[3] & attr
+
+    def get_key_parseinfo_history(self, k):
+        assert k in self
+        return ParseInfoHistory()
+
+    def evaluate_all(self):
+        pass
+
+    def to_dict(self):
+        d = dict()
+        for k, v in self.items():
+            d[k] = v.to_dict() if isinstance(v, SectView) else v
+        return d
+
+    def scopy(self):
+        """
+        :return: (section.Sect) mutable section having same keys.
+        """
+        news = Sect(self.name, False)
+        for i in range(self._n):
+            e = self._entry(i)
+            k = _decode(_read_blob(self._buf, e[0]))
+            v = self._value(e)
+            news[k] = v.scopy() if isinstance(v, SectView) else v
+            news.set_ki(k, e[3], True)
+        return news
+
+
+def dump(sroot, fpath):
+    """
+    Write compiled config file. Existing file is replaced atomically.
+    :param sroot: (section.Sect) root section
+    :param fpath: (str) file path
+    """
+    data = dumps(sroot)
+    tmpf = '%s.%s.tmp' % (os.path.abspath(fpath), uuid.uuid4().hex)
+    # Kernel applies umask to the mode, like files created by 'open'.
+    fd = os.open(tmpf, (os.O_WRONLY | os.O_CREAT | os.O_EXCL
+                        | getattr(os, 'O_BINARY', 0)), 0o666)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.rename(tmpf, fpath)
+        tmpf = None
+    finally:
+        if None is not tmpf and os.path.exists(tmpf):
+            os.remove(tmpf)
+
+
+def load(fpath):
+    """
+    Open compiled config file from 'dump' with mmap. Only pages having
+    accessed keys are read.
+    :param fpath: (str) file path
+    :return: (SectView) read-only view of root section. File is mapped
+             while view(including sub-section views) is alive.
+    """
+    with open(fpath, 'rb') as f:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    return view(mm)
+
+
+def publish(sroot, name=None):
+    """
+    Write section tree to new shared memory block(python 3.8+). Worker
+    processes get read-only view of it with 'attach'. Publisher owns the
+    block. That is, publisher should 'close()' and 'unlink()' it.
+    :param sroot: (section.Sect) root section
+    :param name: (str) name of shared memory block. None means 'new unique
+                 name'.
+    :return: (multiprocessing.shared_memory.SharedMemory) shared memory
+    """
+    from multiprocessing import shared_memory
+    data = dumps(sroot)
+    shm = shared_memory.SharedMemory(name, True, len(data))
+    shm.buf[:len(data)] = data
+    return shm
+
+
+def attach(name):
+    """
+    Attach shared memory block from 'publish'.
+    :param name: (str) name of shared memory block
+    :return: tuple(shm, view) - (SharedMemory) and (SectView) of root
+             section. View is valid until 'shm' is closed.
+    """
+    from multiprocessing import shared_memory
+    shm = shared_memory.SharedMemory(name)
+    return shm, view(shm.buf)
+
+
+# ============================================================================
+#
+#
+#
+# ============================================================================
+def _test_worker(name):
+    shm, sv = attach(name)
+    try:
+        return sv['sec']['k1'], len(sv)
+    finally:
+        del sv
+        shm.close()
+
+
+def test():
+    import shutil
+    from section import KIMAN, KITMP
+    s = Sect(None)
+    s['a'] = 'A'
+    s['b'] = [1, 2]
+    s['c'] = None
+    ss = Sect('sec')
+    ss['k1'] = 'v1'
+    ss['k0'] = u'\uac00'
+    ss.set_ki('k0', KIMAN, True)
+    s['sec'] = ss
+    s['z'] = 'A'
+
+    v = view(dumps(s))
+    assert ['a', 'b', 'c', 'sec', 'z'] == list(v)
+    assert 'A' == v['a'] and [1, 2] == v['b'] and None is v['c']
+    assert 'nokey' not in v and None is v.get('nokey')
+    try:
+        v['nokey']
+        assert False
+    except KeyError:
+        pass
+    assert v.is_section('sec') and 'sec' == v['sec'].name
+    assert ['k1', 'k0'] == list(v['sec'].keys())
+    assert v['sec'].is_ki_set('k0', KIMAN)
+    assert not v['sec'].is_ki_set('k0', KITMP)
+    assert str(s) == str(v)
+    assert s.to_dict() == v.to_dict()
+    s1 = v.scopy()
+    assert s == s1 and s1['sec'].is_ki_set('k0', KIMAN)
+    try:
+        view(b'broken data')
+        assert False
+    except ValueError:
+        pass
+    assert 'v1' == v.get_path('sec:k1')
+    assert 'sec' == v.get_path('sec').name
+    for kp in ('sec:nokey', 'a:b', 'sec:k1:x', ''):
+        try:
+            v.get_path(kp)
+            assert False
+        except KeyError:
+            pass
+        assert None is v.get_path(kp, None)
+        assert 0 == v.get_path(kp, 0)
+    assert 'v1' == v.get_path('sec:k1', None)
+
+    tmpd = tempfile.mkdtemp()
+    try:
+        fpath = os.path.join(tmpd, 'conf.bin')
+        dump(s, fpath)
+        v = load(fpath)
+        assert str(s) == str(v) and u'\uac00' == v.get_path('sec:k0')
+        del v
+        # Same mode with files created by 'open', and no temp file is left.
+        fref = os.path.join(tmpd, 'ref')
+        open(fref, 'wb').close()
+        assert os.stat(fref).st_mode == os.stat(fpath).st_mode
+        assert ['conf.bin', 'ref'] == sorted(os.listdir(tmpd))
+    finally:
+        shutil.rmtree(tmpd)
+
+    try:
+        from multiprocessing import shared_memory
+    except ImportError:
+        shared_memory = None  # before python 3.8
+    if None is not shared_memory:
+        import multiprocessing
+        shm = publish(s)
+        try:
+            pool = multiprocessing.Pool(2)
+            try:
+                assert ([('v1', 5)] * 2
+                        == pool.map(_test_worker, [shm.name] * 2))
+            finally:
+                pool.close()
+                pool.join()
+        finally:
+            shm.close()
+            shm.unlink()
+
+
+if '__main__' == __name__:
+    test()
@@ -36,28 +36,25 @@
 
 # Key-value format handler
 #
-# Formatting syntax (*\w)
-# To escape '(*', use '((*'
+# Formatting syntax {*\w}
+# To escape '{*', use '{{*'
 #
 from __future__ import print_function
 
-import pyparsing as pp
-import threading
+import re
 
-from section import Sect
+from section import Sect, LazyValue, KP_DELIMITER, KITMP
 from errors import EvalError
 
 
-_tlo = threading.local()  # thread local object
-
-
-_KP_DELIMITER = ':'  # Key Path Delimiter
 _UNLIMIT_RECUR_DEPTH = 999999999
 
 
 class _KRef(object):
+    __slots__ = ('is_abs', 'pl')
+
     def __init__(self, tok):
-        pl = tok.split(_KP_DELIMITER)
+        pl = tok.split(KP_DELIMITER)
         if 0 == len(pl):
             raise KeyError
         self.is_abs = (0 == len(pl[0]))
@@ -71,53 +68,96 @@ class _KRef(object):
 
 
 class _KValue(object):
+    __slots__ = ('l',)
+
     def __init__(self, l=None):
         self.l = [] if None is l else l
 
 
-class _Context(object):
-    def __init__(self):
-        self.outs = []  # list of parsed tokens
-        self.pos = 0
-
-
-# ============================================================================
-#
-# Parsing
-#
-# ============================================================================
-def _start_parse():
-    cxt = getattr(_tlo, 'cxt', None)
-    assert None is cxt
-    _tlo.cxt = _Context()
+class _EvalHistory(object):
+    """
+    Key paths being evaluated, to detect recursive reference.
+    List keeps order for EvalError. Set is used for membership test.
+    """
+    __slots__ = ('l', 's')
 
+    def __init__(self):
+        self.l = []
+        self.s = set()
 
-def _finish_parse():
-    assert None is not _tlo.cxt
-    _tlo.cxt = None
+    def __contains__(self, kpathstr):
+        return kpathstr in self.s
 
+    def push(self, kpathstr):
+        self.l.append(kpathstr)
+        self.s.add(kpathstr)
 
-def _context():
-    return _tlo.cxt
+    def pop(self):
+        self.s.discard(self.l.pop())
 
 
-def _fmts_parse_action(ps, loc, toks):
-    c = _context()
-    tok = toks[0]
-    ts = tok[2:-1]  # FORMAT-DEPENDENT
-    c.outs.append(ps[c.pos:loc])
-    c.outs.append(_KRef(ts))
-    c.pos = loc + len(tok)
+class _LazyScope(object):
+    """
+    Root section where _LazyKValues are evaluated.
+    """
+    __slots__ = ('sect', 'npending')
+
+    def __init__(self, sect):
+        self.sect = sect
+        self.npending = 0  # number of _LazyKValues not evaluated yet.
+
+    def evaluated(self):
+        """
+        Called whenever one of _LazyKValues is evaluated.
+        """
+        self.npending -= 1
+        if 0 == self.npending:
+            # Same with 'kveval_all'. Key path index built for references
+            # is not kept to save memory.
+            self.sect.clear_path_index()
+
+
+class _LazyKValue(LazyValue):
+    __slots__ = ('scope', 'kpath', 'kve')
+
+    def __init__(self, scope, kpath, kve):
+        """
+        :param scope: (_LazyScope) scope where key value is evaluated.
+        :param kpath: list(str) key path at root section of 'scope'
+        :param kve: (_KValue) value to be evaluated.
+        """
+        self.scope = scope
+        self.kpath = kpath
+        self.kve = kve  # evaluated value(str) once it is evaluated.
+        scope.npending += 1
+
+    def set_evaluated(self, v):
+        """
+        :param v: (str) evaluated value
+        """
+        self.kve = v
+        self.scope.evaluated()
+
+    def resolve(self):
+        """
+        :return: (str) evaluated value
+        """
+        if isinstance(self.kve, _KValue):
+            v = _eval_kvalue(self.scope.sect, self.kpath, self.kve,
+                             _EvalHistory(), True)
+            assert isinstance(v, str)
+            self.set_evaluated(v)
+        return self.kve
 
 
-def _build_parser():
-    fmts = pp.Regex(r'(?<!\{)\{\*[^\}]+\}')  # FORMAT-DEPENDENT
-    anychar = pp.Regex(r'.')
-    e = fmts ^ anychar
-    fmts.setParseAction(_fmts_parse_action)
-    grammer = pp.StringStart() + pp.ZeroOrMore(e) + pp.StringEnd()
-    grammer.parseWithTabs()
-    return grammer
+# ============================================================================
+#
+# Parsing
+#
+# ============================================================================
+_FMT_MARK = '{*'  # FORMAT-DEPENDENT
+_FMT_ESCAPE = '{{*'  # FORMAT-DEPENDENT
+_FMT_RE = re.compile(r'(?<!\{)\{\*[^\}]+\}')  # FORMAT-DEPENDENT
 
 
 def kvparse2(filepath):
@@ -129,30 +169,23 @@ def kvparse2(filepath):
 def kvparse(s):
     """
     :param s: (str) Source string
-    :return: (list) parsed result.
+    :return: (str or _KValue) parsed result. 's' itself if there is no
+             format to be evaluated.
     """
-    _start_parse()
-    try:
-        _PSR.parseString(s)
-        c = _context()
-        c.outs.append(s[c.pos:])
-        r = _KValue()
-        all_string = True
-        for e in c.outs:
-            if isinstance(e, str):
-                e = e.replace('{{*', '{*')  # FORMAT-DEPENDENT
-            else:
-                all_string = False
-            r.l.append(e)
-        if all_string:
-            return ''.join(r.l)
-        else:
-            return r
-    finally:
-        _finish_parse()
-
-
-_PSR = _build_parser()
+    if _FMT_MARK not in s:
+        # Fast path: neither format nor escaped one.
+        return s
+    l = []
+    pos = 0
+    for m in _FMT_RE.finditer(s):
+        l.append(s[pos:m.start()].replace(_FMT_ESCAPE, _FMT_MARK))
+        l.append(_KRef(m.group()[2:-1]))  # FORMAT-DEPENDENT
+        pos = m.end()
+    if 0 == len(l):
+        # Only escaped formats.
+        return s.replace(_FMT_ESCAPE, _FMT_MARK)
+    l.append(s[pos:].replace(_FMT_ESCAPE, _FMT_MARK))
+    return _KValue(l)
 
 
 # ============================================================================
@@ -179,23 +212,36 @@ def _parse_kpath(rootsect, kpath):
 
 
 def _eval_kref(rootsect, kpath, e, evhis, evkref):
-    kpathstr = _KP_DELIMITER.join(kpath)
+    kpathstr = KP_DELIMITER.join(kpath)
     if evkref and kpathstr in evhis:
         raise KeyError('Recursive reference')
     refpath = e.pl
     if not e.is_abs:
         # relative to abs path
         refpath = kpath[:-1] + e.pl
-    evhis.append(kpathstr)
+    evhis.push(kpathstr)
     try:
-        if evkref:
-            ev = _eval_kvalue(rootsect,
-                              refpath,
-                              _get_keyvalue(rootsect, refpath),
-                              evhis,
-                              True)
+        try:
+            sec, key = rootsect.find_path(KP_DELIMITER.join(refpath))
+        except KeyError:
+            raise KeyError('Invalid key path')
+        lv = sec.get_raw(key)
+        if (isinstance(lv, _LazyKValue)
+                and lv.scope.sect is rootsect):
+            # Evaluated here with 'evhis' to detect recursive reference.
+            ev = lv.kve
         else:
-            ev = _get_keyvalue(rootsect, refpath)
+            lv = None
+            ev = sec[key]
+        if evkref and isinstance(ev, _KValue):
+            ev = _eval_kvalue(rootsect, refpath, ev, evhis, True)
+            assert isinstance(ev, str)
+            # Referenced key is evaluated only once. Keys are evaluated in
+            # dependency order, because evaluated value replaces original
+            # one before referencing key is evaluated.
+            sec.force_setitem(key, ev)
+            if None is not lv:
+                lv.set_evaluated(ev)
         evhis.pop()
         if isinstance(ev, Sect):
             raise KeyError('Section reference')
@@ -206,7 +252,7 @@ def _eval_kref(rootsect, kpath, e, evhis, evkref):
             pih = sec.get_key_parseinfo_history(key)
             if pih.cur_pi():
                 pih.cur_pi().set_current_tag(str(ke))
-            raise EvalError(pih, evhis[:], _KP_DELIMITER.join(refpath))
+            raise EvalError(pih, evhis.l[:], KP_DELIMITER.join(refpath))
         else:
             raise ke
 
@@ -240,7 +286,8 @@ def _eval_sect(rootsect, cs, kpath):
         if isinstance(v, Sect):
             _eval_sect(rootsect, v, kpath + [k])
         elif isinstance(v, _KValue):
-            nv = _eval_kvalue(rootsect, kpath + [k], v, [], True)
+            nv = _eval_kvalue(rootsect, kpath + [k], v,
+                              _EvalHistory(), True)
             assert isinstance(nv, str)
             cs.force_setitem(k, nv)
         else:
@@ -255,13 +302,62 @@ def kveval_all(rootsect):
     :param rootsect: (Sect) Root section to be evaluated.
     """
     _eval_sect(rootsect, rootsect, [])
+    # Key path index built for references is not kept to save memory.
+    rootsect.clear_path_index()
+
+
+def _collect_kvalues(cs, kpath, kvs):
+    """
+    :return: (bool) True if there is temp key.
+    """
+    hastmp = False
+    for k in cs:
+        v = cs.get_raw(k)
+        if isinstance(v, Sect):
+            hastmp = _collect_kvalues(v, kpath + [k], kvs) or hastmp
+        elif isinstance(v, _KValue):
+            kvs.append((cs, k, kpath + [k]))
+        hastmp = hastmp or cs.is_ki_set(k, KITMP)
+    return hastmp
+
+
+def kveval_all_lazy(rootsect):
+    """
+    Lazy version of 'kveval_all'.
+    Key values are evaluated when they are accessed first time, with
+    'rootsect' at that time. If there are temp keys, snapshot of
+    'rootsect' is used instead, because they are removed after parsing.
+    Temp keys are evaluated here, because no one can access them later.
+    :param rootsect: (Sect) Root section to be evaluated.
+    """
+    kvs = []
+    hastmp = _collect_kvalues(rootsect, [], kvs)
+    # Key path index built while parsing - ex. for ':=' - is not kept. It
+    # is built again if it's used, and released when all LazyValues are
+    # evaluated. See '_LazyScope'.
+    rootsect.clear_path_index()
+    if 0 == len(kvs):
+        return
+    scope = _LazyScope(rootsect.scopy() if hastmp else rootsect)
+    tmplvs = []
+    for cs, k, kpath in kvs:
+        lv = _LazyKValue(scope, kpath, cs.get_raw(k))
+        cs.force_setitem(k, lv)
+        if scope.sect is not rootsect:
+            sec, key = _parse_kpath(scope.sect, kpath)
+            sec.force_setitem(key, lv)
+        if cs.is_ki_set(k, KITMP):
+            tmplvs.append(lv)
+    for lv in tmplvs:
+        lv.resolve()
+    scope.sect.clear_path_index()
 
 
 def kveval_parsed_non_recursive(rootsect, kpath, kve):
     return _eval_kvalue(rootsect,
                         kpath,
                         kve,
-                        [],
+                        _EvalHistory(),
                         False)
 
 
@@ -281,22 +377,22 @@ def test():
     # Success cases
     # ============================
     ss = [
-        ('(*a)', '@a'),
-        ('aaa(*a)bbb', 'aaa@abbb'),
-        ('aa\ta(*a)sbbb', 'aa\ta@asbbb'),
-        ('22320sdk,n ae nld 89awe   en\t (*a)sje \r\n;lskd\r m',
+        ('{*a}', '@a'),
+        ('aaa{*a}bbb', 'aaa@abbb'),
+        ('aa\ta{*a}sbbb', 'aa\ta@asbbb'),
+        ('22320sdk,n ae nld 89awe   en\t {*a}sje \r\n;lskd\r m',
          '22320sdk,n ae nld 89awe   en\t @asje \r\n;lskd\r m'),
         # Multiple replacements
-        ('(*a)(*aa)', '@a@aa'),
-        ('1(*a)22(*aa)333(*b)555', '1@a22@aa333@b555'),
-        ('1(*a)\n22(*aa)333\n(*b)555\n',
+        ('{*a}{*aa}', '@a@aa'),
+        ('1{*a}22{*aa}333{*b}555', '1@a22@aa333@b555'),
+        ('1{*a}\n22{*aa}333\n{*b}555\n',
          '1@a\n22@aa333\n@b555\n'),
         # Wierd format
-        ('(*aa bb)(***\n**)', '@aa bb@**\n**'),
+        ('{*aa bb}{***\n**}', '@aa bb@**\n**'),
         # Escape formats
-        ('((*aa)', '(*aa)'),
-        ('((*aa)((*bb)((*b)', '(*aa)(*bb)(*b)'),
-        ('aa(*aa)bb', 'aa@aabb')
+        ('{{*aa}', '{*aa}'),
+        ('{{*aa}{{*bb}{{*b}', '{*aa}{*bb}{*b}'),
+        ('aa{*aa}bb', 'aa@aabb')
     ]
 
     tsect = Sect('___')
@@ -320,7 +416,7 @@ def test():
     # Failure cases
     # ============================
     ss = [
-        '(*unknown)'
+        '{*unknown}'
     ]
     for s in ss:
         tsect['_'] = kvparse(s)
@@ -330,6 +426,19 @@ def test():
             print(str(e))
         del tsect['_']
 
+    # ============================
+    # Lazy evaluation
+    # ============================
+    tsect['_'] = kvparse('{*a}{*b}')
+    tsect['__'] = kvparse('{*_}')
+    kveval_all_lazy(tsect)
+    assert None is tsect._kpidx
+    assert '@a@b' == tsect['_']
+    # Key path index is released when all key values are evaluated.
+    assert None is not tsect._kpidx
+    assert '@a@b' == tsect['__']
+    assert None is tsect._kpidx
+
 
 if '__main__' == __name__:
     test()
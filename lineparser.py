@@ -0,0 +1,284 @@
+################################################################################
+# Copyright (C) 2016, 2017
+# Younghyung Cho. <yhcting77@gmail.com>
+# All rights reserved.
+#
+# This file is part of cfgldr in ypylib
+#
+# This program is licensed under the FreeBSD license
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+# The views and conclusions contained in the software and documentation
+# are those of the authors and should not be interpreted as representing
+# official policies, either expressed or implied, of the FreeBSD Project.
+################################################################################
+
+
+#
+# Hand-written, single-pass and line-oriented config parser.
+#
+# It accepts exactly same syntax with pyparsing grammar built at
+# 'parser._build_recursive_descent_parser', but it doesn't try every
+# alternatives of every line with generic parser elements.
+# Like pyparsing grammar, among matching alternatives, longest one is used,
+# and if lengths are same, first one is used.
+#
+import re
+
+
+# Whitespace characters skipped before each token.
+# This is same with ones used at pyparsing grammar.
+_WS = '\f\v\r'
+
+_SPACES_RE = re.compile(r'[ \t]+')
+# non-comment spaces
+_NCMTSPS_RE = re.compile(r'(?:[ \t](?!#))+')
+_SECT_S_RE = re.compile(r'\[+')
+_SECT_E_RE = re.compile(r'\]+')
+_CMDARG_RE = re.compile(r'\((?:[^\)])*\)', re.MULTILINE | re.DOTALL)
+_SQUOTED_RE = re.compile(r"'(?:[^'\n\r])*'")
+_DQUOTED_RE = re.compile(r'"(?:[^"\n\r])*"')
+_TSQUOTED_RE = re.compile(r"'''(?:[^']|(?:''[^'])|(?:'[^']))*'''",
+                          re.MULTILINE | re.DOTALL)
+_TDQUOTED_RE = re.compile(r'"""(?:[^"]|(?:""[^"])|(?:"[^"]))*"""',
+                          re.MULTILINE | re.DOTALL)
+# unquoted value SHOULD NOT include spaces leading comments
+_UNQUOTED_RE = re.compile(r'([^\n \t]|[ \t]+(?!\s*#))*')
+
+# (regex, length of quote) ordered by priority.
+_VALUE_ALTS = ((_TDQUOTED_RE, 3),
+               (_TSQUOTED_RE, 3),
+               (_DQUOTED_RE, 1),
+               (_SQUOTED_RE, 1),
+               (_UNQUOTED_RE, 0))
+
+
+class LineParseError(Exception):
+    """Syntax error. Attributes are same with ones of pyparsing exception."""
+    def __init__(self, pstr, loc, msg):
+        Exception.__init__(self, msg)
+        self.pstr = pstr
+        self.loc = loc
+        self.msg = msg
+
+
+def _ws(ps, i):
+    n = len(ps)
+    while i < n and ps[i] in _WS:
+        i += 1
+    return i
+
+
+def _match(regex, ps, i):
+    """
+    :return: (match object) None if not matched.
+    """
+    return regex.match(ps, _ws(ps, i))
+
+
+def _comment_end(ps, i):
+    """
+    :param i: position of '#'
+    :return: (int) end position of comment.
+    """
+    e = ps.find('\n', i)
+    return len(ps) if e < 0 else e
+
+
+class LineParser(object):
+    def __init__(self, wordre, keyre, cmdch,
+                 sect_action, cmd_action, keyvalue_action):
+        """
+        :param wordre: (str) regex for name token
+        :param keyre: (str) regex for key token
+        :param cmdch: (str) command prefix character
+        :param sect_action: function(ps, loc, toks) called for section
+        :param cmd_action: function(ps, loc, toks) called for command
+        :param keyvalue_action: function(ps, loc, toks) called for key/value
+        """
+        self.wordre = re.compile(wordre)
+        self.keyre = re.compile(keyre)
+        self.cmdch = cmdch
+        self.sect_action = sect_action
+        self.cmd_action = cmd_action
+        self.keyvalue_action = keyvalue_action
+
+    # ------------------------------------------------------------------------
+    # Each '_try_xxx' function doesn't have side-effect, and returns
+    # (end position, tokens) if matched, otherwise None
+    # ------------------------------------------------------------------------
+    def _try_sect(self, ps, i):
+        m = _SECT_S_RE.match(ps, i)
+        if not m:
+            return None
+        sect_s = m.group()
+        m = _match(_SPACES_RE, ps, m.end())
+        if not m:
+            return None
+        m = _match(self.wordre, ps, m.end())
+        if not m:
+            return None
+        name = m.group()
+        m = _match(_SPACES_RE, ps, m.end())
+        if not m:
+            return None
+        m = _match(_SECT_E_RE, ps, m.end())
+        if not m:
+            return None
+        return m.end(), [sect_s, name, m.group()]
+
+    def _try_cmd(self, ps, i):
+        if not ps.startswith(self.cmdch, i):
+            return None
+        m = _match(self.wordre, ps, i + len(self.cmdch))
+        if not m:
+            return None
+        cmd = m.group()
+        m = _match(_SPACES_RE, ps, m.end())
+        if not m:
+            return None
+        m = _match(_CMDARG_RE, ps, m.end())
+        if not m:
+            return None
+        return m.end(), [cmd, m.group()[1:-1]]
+
+    @staticmethod
+    def _try_value(ps, i):
+        i = _ws(ps, i)
+        best = None
+        for regex, qlen in _VALUE_ALTS:
+            m = regex.match(ps, i)
+            if m and (None is best or m.end() > best[0]):
+                v = m.group()
+                best = (m.end(), v[qlen:len(v) - qlen])
+        return best
+
+    def _try_keyvalue(self, ps, i):
+        m = self.keyre.match(ps, i)
+        if not m:
+            return None
+        toks = [m.group()]
+        m = _match(_SPACES_RE, ps, m.end())
+        if not m:
+            return None
+        i = _ws(ps, m.end())
+        if ps.startswith('=', i):
+            toks.append('=')
+        elif ps.startswith(':=', i):
+            toks.append(':=')
+        else:
+            return None
+        i = _ws(ps, i + len(toks[-1]))
+        m = _NCMTSPS_RE.match(ps, i)
+        if m:
+            r = self._try_value(ps, m.end())
+            if r:
+                i = r[0]
+                toks.append(r[1])
+        return i, toks
+
+    def _try_item(self, ps, i):
+        """
+        :return: (end, action, toks) of longest matching item.
+                 None if nothing matches.
+        """
+        best = None
+        for tryf, action in ((self._try_sect, self.sect_action),
+                             (self._try_cmd, self.cmd_action),
+                             (self._try_keyvalue, self.keyvalue_action)):
+            r = tryf(ps, i)
+            if r and (None is best or r[0] > best[0]):
+                best = (r[0], action, r[1])
+        return best
+
+    def _parse_entry(self, ps, i):
+        """
+        Parse one entry(line) starting at 'i'.
+        :return: tuple(end position of entry, item). item is tuple(action,
+                 location, toks) or None if entry doesn't have item.
+        """
+        # Alternative 1: comment line
+        cmtend = -1
+        j = _ws(ps, i)
+        if ps.startswith('#', j):
+            cmtend = _comment_end(ps, j)
+
+        # Alternative 2:
+        #     [non-comment-spaces] [item] [non-comment-spaces] [comment]
+        j = _ws(ps, i)
+        m = _NCMTSPS_RE.match(ps, j)
+        if m:
+            j = m.end()
+        j = _ws(ps, j)
+        itemloc = j
+        item = self._try_item(ps, j)
+        if item:
+            j = item[0]
+        j = _ws(ps, j)
+        m = _NCMTSPS_RE.match(ps, j)
+        if m:
+            j = m.end()
+        j = _ws(ps, j)
+        if j < len(ps) and ps[j] in ' \t':
+            k = _ws(ps, j + 1)
+            if ps.startswith('#', k):
+                j = _comment_end(ps, k)
+
+        if cmtend >= j:
+            return cmtend, None
+        if item:
+            (_, action, toks) = item
+            return j, (action, itemloc, toks)
+        return j, None
+
+    def iterparse(self, ps):
+        """
+        Generator version of 'parseString'. Instead of running parse action,
+        tuple(action, location, toks) of each item is yielded one by one.
+        :param ps: (str) string to parse. Tabs should be expanded already.
+        """
+        n = len(ps)
+        i, item = self._parse_entry(ps, _ws(ps, 0))
+        while True:
+            if item:
+                yield item
+            j = _ws(ps, i)
+            if j < n and '\n' == ps[j]:
+                i, item = self._parse_entry(ps, j + 1)
+            elif j < n:
+                raise LineParseError(ps, j, 'Syntax error')
+            else:
+                return
+
+    def parseString(self, ps, parseAll=True):
+        """
+        Same interface with 'parseString' of pyparsing grammar.
+        Tabs are expanded like pyparsing.
+        :param ps: (str) string to parse
+        :param parseAll: Only 'True' is supported.
+        """
+        assert parseAll
+        ps = ps.expandtabs()
+        for action, loc, toks in self.iterparse(ps):
+            action(ps, loc, toks)
@@ -38,22 +38,356 @@
 # Main interface file for cfgldr module.
 #
 import parser
+import cache
+import flat
+from deps import Deps
+
+
+class ConfigLoader(object):
+    """
+    Config loader owning its parser. So, different loaders can load configs
+    at different threads at the same time. But, a loader is used by only
+    one thread at a time.
+    """
+    def __init__(self, confdict=None, verifierdict=None,
+                 vrf_ruledict=None, cachedir=None, include_memo=None,
+                 engine=parser.ENGINE_PYPARSING, lazy=False, vrf_pool=None,
+                 include_pool=None, track_provenance=True, frozen=False):
+        """
+        :param confdict: (dict) That can be used as named-replacement-dict for
+                         conf
+        :param verifierdict: (dict) That can be used as named-replacement-dict
+                             for verifier. Not used if verifier is
+                             verifier.Verifier.
+        :param vrf_ruledict: (dict) Custom symbols(including functions) to be
+                             used as global dict to eval verifier rule. Not
+                             used if verifier is verifier.Verifier.
+        :param cachedir: (str) Directory for on-disk cache of loaded config.
+                         If cached config is still valid - none of files
+                         read while loading are changed - it is used instead
+                         of parsing files. None means 'cache is not used'.
+        :param include_memo: (parser.IncludeMemo) Memo of parsed include
+                             files shared among loads. It should be created
+                             with 'validate=True'. None means 'memo only for
+                             each load'.
+        :param engine: (str) Parsing engine - one of parser.ENGINE_XXX.
+                       parser.ENGINE_LINE is much faster than default one.
+        :param lazy: (bool) Evaluate key values when they are accessed first
+                     time. See parser.parse_conf(). Config to be cached is
+                     evaluated before being stored.
+        :param vrf_pool: (multiprocessing.pool.Pool or ThreadPool) pool used
+                         to verify top-level sections in parallel.
+                         See verifier.Verifier.verify().
+        :param include_pool: (multiprocessing.pool.Pool) process pool used to
+                             parse files included by glob in parallel.
+                             See parser.parse_conf().
+        :param track_provenance: (bool) False means parse info history of
+                                 keys are not recorded, to save memory.
+                                 See parser.parse_conf().
+        :param frozen: (bool) Return immutable snapshot - section.FrozenSect
+                       - that can be shared among threads without copying.
+                       See section.Sect.freeze().
+        """
+        self.confdict = confdict
+        self.verifierdict = verifierdict
+        self.vrf_ruledict = vrf_ruledict
+        self.cachedir = cachedir
+        self.include_memo = include_memo
+        self.engine = engine
+        self.lazy = lazy
+        self.vrf_pool = vrf_pool
+        self.include_pool = include_pool
+        self.track_provenance = track_provenance
+        self.frozen = frozen
+        self.parser = parser.Parser()
+
+    def _parse_conf(self, fconf, fverifier, deps):
+        return self.parser.parse_conf(fconf, fverifier,
+                                      self.confdict, self.verifierdict,
+                                      self.vrf_ruledict, deps,
+                                      self.include_memo, self.engine,
+                                      self.lazy, self.vrf_pool,
+                                      self.include_pool,
+                                      self.track_provenance)
+
+    def load(self, fconf, fverifier):
+        """
+        Load config file and returns corresponding 'dict' structure.
+        :param fconf: (str) config file path
+        :param fverifier: (str) verifier file path or (verifier.Verifier)
+                          from 'load_verifier'. None is allowed.
+        :return: (section.Sect) root section
+        """
+        sroot = self._load(fconf, fverifier)
+        return sroot.freeze() if self.frozen else sroot
+
+    def _load(self, fconf, fverifier):
+        if None is self.cachedir:
+            return self._parse_conf(fconf, fverifier, None)
+        key = cache.make_key(fconf, fverifier,
+                             self.confdict, self.verifierdict,
+                             self.vrf_ruledict, self.track_provenance)
+        sroot = cache.load(self.cachedir, key)
+        if None is not sroot:
+            return sroot
+        deps = Deps()
+        sroot = self._parse_conf(fconf, fverifier, deps)
+        sroot.evaluate_all()
+        cache.store(self.cachedir, key, deps, sroot)
+        return sroot
+
+    def load_verifier(self, fverifier):
+        """
+        Load verifier file. Returned verifier can be used as 'fverifier' of
+        'load' several times without parsing verifier file again.
+        :return: (verifier.Verifier) verifier
+        """
+        return self.parser.parse_verifier(fverifier, self.verifierdict,
+                                          self.vrf_ruledict,
+                                          engine=self.engine)
+
+    def cancel(self):
+        """
+        Cancel loading in progress. See parser.Parser.cancel().
+        """
+        self.parser.cancel()
 
 
 def load_config(fconf, fverifier,
                 confdict=None, verifierdict=None,
-                vrf_ruledict=None):
+                vrf_ruledict=None, cachedir=None, include_memo=None,
+                engine=parser.ENGINE_PYPARSING, lazy=False, vrf_pool=None,
+                include_pool=None, track_provenance=True, frozen=False):
     """
     Load config file and returns corresponding 'dict' structure.
-    :param fconf: (str) config file path
-    :param fverifier: (str) verifier file path. None is allowed.
-    :param confdict: (dict) That can be used as named-replacement-dict for conf
-    :param verifierdict: (dict) That can be used as named-replacement-dict for
-                         verifier
-    :param vrf_ruledict: (dict) Custom symbols(including functions) to be used
-                         as global dict to eval verifier rule.
+    See ConfigLoader for arguments.
     :return: (section.Sect) root section
     """
-    return parser.parse_conf(fconf, fverifier,
-                             confdict, verifierdict,
-                             vrf_ruledict)
+    return ConfigLoader(confdict, verifierdict, vrf_ruledict, cachedir,
+                        include_memo, engine, lazy, vrf_pool,
+                        include_pool, track_provenance,
+                        frozen).load(fconf, fverifier)
+
+
+def load_config_async(fconf, fverifier,
+                      confdict=None, verifierdict=None,
+                      vrf_ruledict=None, cachedir=None, include_memo=None,
+                      engine=parser.ENGINE_PYPARSING, lazy=False,
+                      vrf_pool=None, include_pool=None,
+                      track_provenance=True, frozen=False, loop=None,
+                      executor=None):
+    """
+    Load config at executor - reading files, parsing, evaluation and
+    verification - not to block event loop of asyncio.
+    Cancelling returned future cancels loading. But, cancellation is
+    checked only before parsing each file and before verification. So,
+    file being parsed when it is cancelled is parsed to the end.
+    See ConfigLoader for arguments.
+    :param loop: (asyncio.AbstractEventLoop) None means running event loop.
+                 It should be called at running event loop in this case.
+    :param executor: (concurrent.futures.Executor) None means default
+                     executor of 'loop'.
+    :return: (asyncio.Future) future whose result is root section. Errors
+             are same with the ones of 'load_config'.
+    """
+    import asyncio
+    if None is loop:
+        try:
+            loop = asyncio.get_running_loop()
+        except AttributeError:
+            loop = asyncio.get_event_loop()  # before python 3.7
+    ldr = ConfigLoader(confdict, verifierdict, vrf_ruledict, cachedir,
+                       include_memo, engine, lazy, vrf_pool, include_pool,
+                       track_provenance, frozen)
+
+    def on_done(fut):
+        if fut.cancelled():
+            ldr.cancel()
+
+    fut = loop.run_in_executor(executor, ldr.load, fconf, fverifier)
+    fut.add_done_callback(on_done)
+    return fut
+
+
+def load_verifier(fverifier, verifierdict=None, vrf_ruledict=None,
+                  engine=parser.ENGINE_PYPARSING):
+    """
+    Load verifier file. Returned verifier can be used as 'fverifier' of
+    'load_config' several times without parsing verifier file again.
+    See ConfigLoader for arguments.
+    :return: (verifier.Verifier) verifier
+    """
+    return ConfigLoader(verifierdict=verifierdict, vrf_ruledict=vrf_ruledict,
+                        engine=engine).load_verifier(fverifier)
+
+
+def compile_config(fconf, fverifier, fout,
+                   confdict=None, verifierdict=None, vrf_ruledict=None,
+                   engine=parser.ENGINE_PYPARSING):
+    """
+    Load, evaluate and verify config, and write it to compiled config file.
+    Compiled config is opened by flat.load() without parsing.
+    See ConfigLoader for arguments.
+    :param fout: (str) compiled config file path
+    """
+    sroot = load_config(fconf, fverifier, confdict, verifierdict,
+                        vrf_ruledict, engine=engine, track_provenance=False)
+    flat.dump(sroot, fout)
+
+
+class Reloader(object):
+    """
+    Load config again only if files are changed after previous load.
+    Parsed results of included files are memoized, and only changed files
+    and files including them (directly or indirectly) are parsed again.
+    Evaluation and verification always run again on reload.
+    """
+    def __init__(self, fconf, fverifier,
+                 confdict=None, verifierdict=None,
+                 vrf_ruledict=None, engine=parser.ENGINE_PYPARSING,
+                 lazy=False, vrf_pool=None, include_pool=None,
+                 track_provenance=True, frozen=False):
+        """
+        See ConfigLoader for arguments.
+        """
+        self.fconf = fconf
+        self.fverifier = fverifier
+        self.confdict = confdict
+        self.verifierdict = verifierdict
+        self.vrf_ruledict = vrf_ruledict
+        self.engine = engine
+        self.lazy = lazy
+        self.vrf_pool = vrf_pool
+        self.include_pool = include_pool
+        self.track_provenance = track_provenance
+        self.frozen = frozen
+        self.memo = parser.IncludeMemo(True)
+        self.parser = parser.Parser()
+        self.deps = None
+        self.sroot = None
+
+    def is_uptodate(self):
+        """
+        :return: (bool) True if none of files are changed after last load.
+        """
+        return (None is not self.sroot
+                and self.deps.is_uptodate())
+
+    def load(self):
+        """
+        Load config. If nothing is changed after last load, last one is
+        returned. Otherwise new root section is returned.
+        On error, last loaded config is kept.
+        :return: (section.Sect) root section
+        """
+        if self.is_uptodate():
+            return self.sroot
+        deps = Deps()
+        sroot = self.parser.parse_conf(self.fconf, self.fverifier,
+                                       self.confdict, self.verifierdict,
+                                       self.vrf_ruledict, deps, self.memo,
+                                       self.engine, self.lazy, self.vrf_pool,
+                                       self.include_pool,
+                                       self.track_provenance)
+        if self.frozen:
+            sroot = sroot.freeze()
+        # Files not included anymore.
+        self.memo.retain(deps.files)
+        self.deps = deps
+        self.sroot = sroot
+        return sroot
+
+
+def test():
+    import os.path
+    import shutil
+    import tempfile
+    from errors import CancelledError, FileIOError
+    from section import FrozenSect
+
+    tmpd = tempfile.mkdtemp()
+    try:
+        fconf = os.path.join(tmpd, 'conf')
+        os.mkdir(os.path.join(tmpd, 'conf.d'))
+        fa = os.path.join(tmpd, 'conf.d', 'a')
+        fb = os.path.join(tmpd, 'conf.d', 'b')
+        fc = os.path.join(tmpd, 'conf.d', 'c')
+        with open(fconf, 'w') as f:
+            f.write('@include (conf.d/*)\nkey = {*a}-{*b}\n')
+        with open(fa, 'w') as f:
+            f.write('a = a0\n')
+        with open(fb, 'w') as f:
+            f.write('b = b0\n')
+
+        rl = Reloader(fconf, None)
+        s0 = rl.load()
+        assert 'a0-b0' == s0['key']
+        assert s0 is rl.load()
+        ea = rl.memo.get((fa, False, None, True))
+        eb = rl.memo.get((fb, False, None, True))
+        assert None is not ea and None is not eb
+
+        # Only changed file is parsed again.
+        with open(fb, 'w') as f:
+            f.write('b = b1\n')
+        s1 = rl.load()
+        assert s1 is not s0
+        assert 'a0-b1' == s1['key']
+        assert ea is rl.memo.get((fa, False, None, True))
+        assert eb is not rl.memo.get((fb, False, None, True))
+
+        # Result of glob expansion is changed.
+        with open(fc, 'w') as f:
+            f.write('a = a1\n')
+        os.remove(fa)
+        s2 = rl.load()
+        assert 'a1-b1' == s2['key']
+        assert None is rl.memo.get((fa, False, None, True))
+
+        ldr = ConfigLoader()
+        ldr.cancel()
+        try:
+            ldr.load(fconf, None)
+            assert False
+        except CancelledError:
+            pass
+        assert 'a1-b1' == ldr.load(fconf, None)['key']
+        fbin = os.path.join(tmpd, 'conf.bin')
+        compile_config(fconf, None, fbin)
+        sv = flat.load(fbin)
+        assert 'a1-b1' == sv.get_path('key')
+        del sv
+        sf = load_config(fconf, None, frozen=True)
+        assert isinstance(sf, FrozenSect)
+        assert s2 == sf and hash(sf) == hash(s2.freeze())
+
+        try:
+            import asyncio
+        except ImportError:
+            asyncio = None  # python2
+        if None is not asyncio:
+            loop = asyncio.new_event_loop()
+            try:
+                s3 = loop.run_until_complete(
+                    load_config_async(fconf, None, loop=loop))
+                assert 'a1-b1' == s3['key']
+                # Running event loop is used by default.
+                futs = []
+                loop.call_soon(
+                    lambda: futs.append(load_config_async(fconf, None)))
+                loop.run_until_complete(asyncio.sleep(0))
+                assert 'a1-b1' == loop.run_until_complete(futs[0])['key']
+                try:
+                    loop.run_until_complete(load_config_async(
+                        os.path.join(tmpd, 'noconf'), None, loop=loop))
+                    assert False
+                except FileIOError:
+                    pass
+            finally:
+                loop.close()
+    finally:
+        shutil.rmtree(tmpd)
+
+
+if '__main__' == __name__:
+    test()
@@ -0,0 +1,137 @@
+################################################################################
+# Copyright (C) 2016, 2017
+# Younghyung Cho. <yhcting77@gmail.com>
+# All rights reserved.
+#
+# This file is part of cfgldr in ypylib
+#
+# This program is licensed under the FreeBSD license
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+# The views and conclusions contained in the software and documentation
+# are those of the authors and should not be interpreted as representing
+# official policies, either expressed or implied, of the FreeBSD Project.
+################################################################################
+
+
+#
+# Memory benchmark of loaded config.
+#
+# Synthetic config - sections of keys, where every odd key references the
+# previous key - is loaded with line engine, and memory retained by the
+# loaded root section is measured with 'tracemalloc' (python 3.4+).
+#
+#     python membench.py [--sections N] [--keys N]
+#
+from __future__ import print_function
+import sys
+import os
+import os.path
+import gc
+import shutil
+import tempfile
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import parser
+
+
+def write_config(fpath, nsect, nkey):
+    """
+    :param fpath: (str) path of config file to write.
+    :param nsect: (int) number of sections.
+    :param nkey: (int) number of keys in each section.
+    """
+    with open(fpath, 'w') as f:
+        for i in range(nsect):
+            f.write('[ s%d ]\n' % i)
+            for j in range(nkey):
+                if j % 2:
+                    f.write('    key%d = v{*key%d}\n' % (j, j - 1))
+                else:
+                    f.write('    key%d = value %d\n' % (j, j))
+
+
+def measure(fconf, lazy):
+    """
+    :return: (int) bytes retained by root section loaded from 'fconf'.
+    """
+    import tracemalloc
+    gc.collect()
+    tracemalloc.start()
+    try:
+        s = parser.parse_conf(fconf, None, None, None,
+                              engine=parser.ENGINE_LINE, lazy=lazy)
+        gc.collect()
+        cur, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    del s
+    return cur
+
+
+def run(nsect, nkey):
+    """
+    :return: list(tuple(lazy, bytes)) retained memory of eager and lazy
+             loads.
+    """
+    tmpd = tempfile.mkdtemp()
+    try:
+        fconf = os.path.join(tmpd, 'conf')
+        write_config(fconf, nsect, nkey)
+        return [(lazy, measure(fconf, lazy)) for lazy in (False, True)]
+    finally:
+        shutil.rmtree(tmpd)
+
+
+def main():
+    ap = argparse.ArgumentParser(description='Memory benchmark of config')
+    ap.add_argument('--sections', type=int, default=1000,
+                    help='number of sections')
+    ap.add_argument('--keys', type=int, default=100,
+                    help='number of keys in each section')
+    args = ap.parse_args()
+    try:
+        import tracemalloc
+    except ImportError:
+        sys.exit('tracemalloc is required (python 3.4+)')
+    n = args.sections * args.keys
+    print('%d keys (%d sections x %d keys), python %d.%d'
+          % (n, args.sections, args.keys,
+             sys.version_info[0], sys.version_info[1]))
+    for lazy, cur in run(args.sections, args.keys):
+        print('%s: %d bytes/key (%.1fMB)'
+              % ('lazy' if lazy else 'eager', cur // n, cur / 1e6))
+
+
+def test():
+    try:
+        import tracemalloc
+    except ImportError:
+        return
+    for lazy, cur in run(2, 10):
+        assert 0 < cur
+
+if '__main__' == __name__:
+    main()
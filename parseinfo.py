@@ -42,6 +42,8 @@ class ConfPos(object):
     """
     Position at config file
     """
+    __slots__ = ('file', 'ps', 'loc', 'tag')
+
     def __init__(self, fconf, ps, loc=0, tag=''):
         """
         :param fconf: (str) config file path
@@ -82,6 +84,8 @@ class ParsePos(object):
     """
     Parse position
     """
+    __slots__ = ('_cfpol',)
+
     def __init__(self, cfpolist=None):
         """
         :param cfpolist: list(ConfPos)
@@ -121,6 +125,8 @@ class SectPath(object):
     """
     Section path
     """
+    __slots__ = ('path',)
+
     def __init__(self, path=None):
         """
         :param path: list(str) list(stack-path) of section names
@@ -131,18 +137,57 @@ class SectPath(object):
         return '> ' + ' > '.join(self.path)
 
 
+class Source(object):
+    """
+    Parse string of config file. It is shared by positions at the file.
+    """
+    __slots__ = ('file', 'ps')
+
+    def __init__(self, fconf, ps):
+        """
+        :param fconf: (str) config file path
+        :param ps: (str) parse string of the file
+        """
+        self.file = fconf
+        self.ps = ps
+
+
 class ParseInfo(object):
     """
     Parse information of key.
+    Include stack and section path are tuples shared by parse infos created
+    at same context. Full positions - 'prpo' and 'sectpath' - are built
+    only when they are used - ex. rendering error message.
     """
-    def __init__(self, prpo, sectpath):
+    __slots__ = ('stk', 'src', 'loc', 'sp', 'tag')
+
+    def __init__(self, stk, src, loc, sp, tag=''):
         """
-        :param prpo: (ParsePos)
-        :param sectpath: (SectPath)
+        :param stk: tuple((Source, int)) positions of include stack except
+                    for current file. index 0 is root(base) config.
+        :param src: (Source) current file
+        :param loc: (int) current parsed location at 'src'
+        :param sp: tuple(str) section path
+        :param tag: (str) custom tag message for current position
         """
-        assert isinstance(prpo, ParsePos) and isinstance(sectpath, SectPath)
-        self.prpo = prpo
-        self.sectpath = sectpath
+        assert isinstance(stk, tuple) and isinstance(sp, tuple)
+        self.stk = stk
+        self.src = src
+        self.loc = loc
+        self.sp = sp
+        self.tag = tag
+
+    @property
+    def prpo(self):
+        """(ParsePos) include stack"""
+        cfpol = [ConfPos(src.file, src.ps, loc) for src, loc in self.stk]
+        cfpol.append(ConfPos(self.src.file, self.src.ps, self.loc, self.tag))
+        return ParsePos(cfpol)
+
+    @property
+    def sectpath(self):
+        """(SectPath) section path"""
+        return SectPath(list(self.sp))
 
     def __str__(self):
         return '''\
@@ -158,29 +203,44 @@ class ParseInfo(object):
         :param confpath: (str)
         :return:
         """
-        cp = ConfPos(confpath, '')
-        return ParseInfo(ParsePos([cp]), SectPath())
+        return ParseInfo((), Source(confpath, ''), 0, ())
+
+    def rebase(self, depth, prefix, spdepth, spprefix, cache=None):
+        """
+        Create parse info whose bottom 'depth' positions of include stack are
+        replaced with 'prefix', and leading 'spdepth' section names of section
+        path are replaced with 'spprefix'.
+        :param depth: (int)
+        :param prefix: tuple((Source, int))
+        :param spdepth: (int)
+        :param spprefix: tuple(str)
+        :param cache: (dict) Rebased include stack and section path are
+                      cached to it, to be shared by parse infos rebased
+                      with same arguments.
+        :return: (ParseInfo)
+        """
+        key = (self.stk, self.sp)
+        v = None if None is cache else cache.get(key)
+        if None is v:
+            v = (prefix + self.stk[depth:], spprefix + self.sp[spdepth:])
+            if None is not cache:
+                cache[key] = v
+        return ParseInfo(v[0], self.src, self.loc, v[1], self.tag)
 
     def set_current_pos(self, ps, loc):
-        if (None is self.prpo
-                or 0 == self.prpo.size()):
-            return
-        cfpo = self.prpo.peek()
-        cfpo.ps = ps
-        cfpo.loc = loc
+        self.src = Source(self.src.file, ps)
+        self.loc = loc
 
     def set_current_tag(self, tag):
-        if (None is self.prpo
-                or 0 == self.prpo.size()):
-            return
-        cfpo = self.prpo.peek()
-        cfpo.tag = tag
+        self.tag = tag
 
 
 class ParseInfoHistory(object):
     """
     List of parse info
     """
+    __slots__ = ('pis',)
+
     def __init__(self):
         self.pis = list()
 
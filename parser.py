@@ -38,16 +38,24 @@
 from __future__ import print_function
 import sys
 import os.path
-import glob
+import threading
 
 import logger
+import deps as depsmod
 import verifier
 import pyparsing as pp
+import lineparser
 import section
 import kvfmt
 from section import Sect
-from parseinfo import ConfPos, ParsePos, SectPath, ParseInfo
-from errors import BaseError, ParseError, FileIOError
+from parseinfo import Source, ParseInfo
+from errors import (BaseError, ParseError, FileIOError, EvalError,
+                    CancelledError)
+
+try:
+    from sys import intern
+except ImportError:
+    pass  # python2 builtin
 
 P = logger.P(__name__)
 # P.set_level(P.VERBOSE)
@@ -60,21 +68,30 @@ _SHOW_TEST_NOK_MSG = True
 
 class Context(object):
     """Context used to parse a config file."""
-    def __init__(self, fconf):
-        self.ss = [Sect(None)]
-        self.cfpo = ConfPos(os.path.abspath(fconf), None, 0)
+    def __init__(self, fconf, stk=(), sp=(), track=True):
+        """
+        :param fconf: (str) config file path
+        :param stk: tuple((Source, int)) positions of outer files at include
+                    stack. See parseinfo.ParseInfo.
+        :param sp: tuple(str) section path where file is parsed.
+        :param track: (bool) parse info of keys are recorded.
+        """
+        self.ss = [Sect(None, track)]
+        self.file = intern(os.path.abspath(fconf))
+        self._src = Source(self.file, None)  # Source of last parse string
+        # Position set by 'setloc' - ex. position of include command.
+        self.pos = (self._src, 0)
+        self.stk = stk
+        self.sps = [sp]  # section path of each section at 'ss'
+        self.deps = depsmod.Deps()  # files read while parsing this context
 
     def __getattr__(self, aname):
         """Dummy function for future use."""
         raise AttributeError(aname)
 
-    @property
-    def file(self):
-        return self.cfpo.file
-
     @property
     def cwd(self):
-        return os.path.dirname(self.cfpo.file)
+        return os.path.dirname(self.file)
 
     @property
     def sroot(self):
@@ -92,15 +109,30 @@ class Context(object):
         """Current working section"""
         return self.ss[-1]
 
+    @property
+    def sectpath(self):
+        """Section path of current working section"""
+        return self.sps[-1]
+
     def spop(self):
+        self.sps.pop()
         return self.ss.pop()
 
     def spush(self, s):
         self.ss.append(s)
+        self.sps.append(self.sps[-1] + (s.name,))
+
+    def source(self, ps):
+        """
+        :return: (Source) source of parse string. It is shared while same
+                 parse string is used.
+        """
+        if ps is not self._src.ps:
+            self._src = Source(self.file, ps)
+        return self._src
 
     def setloc(self, ps, loc):
-        self.cfpo.ps = ps
-        self.cfpo.loc = loc
+        self.pos = (self.source(ps), loc)
 
 
 class ContextManager(object):
@@ -108,6 +140,17 @@ class ContextManager(object):
     def __init__(self):
         self.cstk = []
         self.repldict = None  # dictionary for named replacement
+        self.repldict_key = None  # comparable key of 'repldict'
+        self.vrfconf = False  # True if verifier file is parsed
+        self.lazy = False  # True if config values are evaluated lazily
+        self.track = True  # True if parse info of keys are recorded
+        self.memo = None  # (IncludeMemo) memo of parsed include files
+        self.engine = None  # parsing engine
+        self.pool = None  # process pool to parse included files
+        self.nimmeval = 0  # number of immediate evaluations(':=')
+        # (section, memo keys, writable) of the last 'include'-like command.
+        # It is reset by any other statements.
+        self.last_merge = None
 
     @property
     def context(self):
@@ -123,35 +166,22 @@ class ContextManager(object):
                  None if there is no matching context.
         """
         for c in self.cstk:
-            if c.cfpo.file == fconf:
+            if c.file == fconf:
                 return c
         return None
 
     def get_current_sect_path(self):
-        sectpath = []
-        for c in self.cstk:
-            for s in c.ss:
-                if None is s.name:
-                    continue
-                sectpath.append(s.name)
-        return sectpath
+        return list(self.context.sectpath)
 
     def create_parseinfo(self, ps=None, loc=None, tag=None):
-        po = ParsePos([c.cfpo.clone() for c in self.cstk])
-        sectpath = []
-        for c in self.cstk:
-            for s in c.ss:
-                if None is s.name:
-                    continue
-                sectpath.append(s.name)
-        sp = SectPath(self.get_current_sect_path())
-        pi = ParseInfo(po, sp)
+        c = self.context
         if (None is not ps
                 and None is not loc):
-            pi.set_current_pos(ps, loc)
-        if None is not tag:
-            pi.set_current_tag(tag)
-        return pi
+            src = c.source(ps)
+        else:
+            src, loc = c.pos
+        return ParseInfo(c.stk, src, loc, c.sectpath,
+                         '' if None is tag else tag)
 
     def parse_start(self, ps, loc, fconf):
         """
@@ -164,22 +194,89 @@ class ContextManager(object):
         if len(self.cstk) > 0:
             c = self.context
             c.setloc(ps, loc)
-        self.cstk.append(Context(fconf))
+            self.cstk.append(Context(fconf, c.stk + (c.pos,), c.sectpath,
+                                     self.track))
+        else:
+            self.cstk.append(Context(fconf, track=self.track))
 
-    def parse_end(self):
+    def parse_end(self, failed=False):
         """
         End current parsing context.
         Current working context is changed to previous one.
         And parsed context is returned.
+        :param failed: (bool) True if parsing fails.
         """
         P.d('parse_end')
         c = self.cstk.pop()
-        kvfmt.kveval_all(c.sroot)
+        if len(self.cstk) > 0:
+            self.context.deps.update(c.deps)
+        if self.lazy and not self.vrfconf:
+            # Error of failed lazy parsing is decided by parsing again
+            # eagerly. See 'Parser.parse_conf'.
+            if not failed:
+                kvfmt.kveval_all_lazy(c.sroot)
+        else:
+            kvfmt.kveval_all(c.sroot)
         c.sroot.clear_temp_keys(True)
 
 
-# context manager
-_cm = ContextManager()
+class _MemoEntry(object):
+    def __init__(self, sroot, depth, sectpath, immeval, deps):
+        """
+        :param sroot: (Sect) root section of parsed file.
+        :param depth: (int) depth of include stack where file is parsed.
+        :param sectpath: tuple(str) section path where file is parsed.
+        :param immeval: (bool) True if immediate evaluation - depending on
+                        section path - is used while parsing file.
+        :param deps: (deps.Deps) files read while parsing file.
+        """
+        self.sroot = sroot
+        self.depth = depth
+        self.sectpath = sectpath
+        self.immeval = immeval
+        self.deps = deps
+        self.has_final = _has_final_key(sroot)
+
+
+class IncludeMemo(object):
+    """
+    Memo of parsed root section of included files.
+    Same file included again with same context is not parsed again.
+    """
+    def __init__(self, validate=False):
+        """
+        :param validate: (bool) Validate entry with files read while parsing
+                         it. This should be True if memo is shared among
+                         several loads - ex. process-wide memo.
+        """
+        self.validate = validate
+        self.entries = {}
+
+    def get(self, key):
+        e = self.entries.get(key)
+        if (None is not e
+                and self.validate
+                and not e.deps.is_uptodate()):
+            # Memo may be shared among parsers at different threads.
+            self.entries.pop(key, None)
+            e = None
+        return e
+
+    def put(self, key, entry):
+        self.entries[key] = entry
+
+    def retain(self, files):
+        """
+        Remove entries of files that are not in 'files'.
+        :param files: (iterable) files to keep memo.
+        """
+        files = set(files)
+        for key in list(self.entries):
+            if key[0] not in files:
+                del self.entries[key]
+
+    def clear(self):
+        self.entries.clear()
 
 
 # ============================================================================
@@ -191,6 +288,16 @@ def _is_abspath(v):
     return v[0] == os.path.sep
 
 
+def _has_final_key(s):
+    for k in s:
+        if s.is_ki_set(k, section.KIFIN):
+            return True
+        if (s.is_section(k)
+                and _has_final_key(s[k])):
+            return True
+    return False
+
+
 # ============================================================================
 #
 # Parser constants
@@ -201,193 +308,47 @@ _KIFIN_CH = '!'  # Final key prefix
 _KITMP_CH = '~'  # Temporal key prefix
 _KICMD_CH = '@'  # Command prefix
 
-
-# ============================================================================
-#
-# Action functions
-#
-# ============================================================================
-def _glob_include_files(v):
-    c = _cm.context
-    pathvalue = v if _is_abspath(v) else os.path.join(c.cwd, v)
-    files = []
-    for f in glob.glob(pathvalue):
-        if os.path.isfile(f):
-            files.append(f)
-    return files
-
-
-def _merge_section(dst, src, ps, loc):
-    try:
-        dst.supdate(src)
-    except KeyError as e:
-        raise ParseError(_cm.create_parseinfo(ps, loc, str(e)))
-
-
-def _include_files(ps, loc, v, writable):
-    files = _glob_include_files(v)
-    if 0 == len(files):
-        raise FileIOError(_cm.create_parseinfo(
-            None, -1, 'Fail to access config file'))
-    for f in sorted(files):
-        subs = _parse_conf(ps, loc, f).sroot
-        if writable:
-            subs.set_writable()
-        else:
-            subs.set_readonly()
-        _merge_section(_cm.context.cws, subs, ps, loc)
-
-
-# return None if success, otherwise error message.
-def _cmdhandle_inherit(ps, loc, v):
-    """
-    Inherit from external config file. Overwriting included keys are allowed.
-    """
-    _include_files(ps, loc, v, True)
-
-
-def _cmdhandle_include(ps, loc, v):
-    """
-    Include external config file. Overwriting included keys are NOT allowed.
-    """
-    _include_files(ps, loc, v, False)
-
-
-def _cmdhandle_rmkeys(ps, loc, v):
-    """
-    Remove keys from current working section.
-    """
-    cc = _cm.context
-    s = cc.cws
-    for key in v.split():
-        if key in s:
-            del s[key]
-        else:
-            raise ParseError(_cm.create_parseinfo(
-                ps, loc, 'Unknown key : ' + key))
-
-
-_cmdhandler_map = {
-    # 'inherit' and 'include' are basically same - including external config.
-    # Difference is that caller can override section key created by 'inherit'.
-    # But, in case of 'include' this case raise 'DuplicatedKey' error.
-    'inherit': _cmdhandle_inherit,
-    'include': _cmdhandle_include,
-    # Supporing 'rmkeys' commands may break 'key overwriting protection'.
-    # Therefore, 'rmkeys' command is disabled.
-    # 'rmkeys': _cmdhandle_rmkeys
-}
-
-
-def _cmd_parse_action(ps, loc, toks):
-    assert(2 == len(toks))
-    cmd = toks[0].strip()
-    value = toks[1].strip()
-    if cmd not in _cmdhandler_map:
-        raise ParseError(_cm.create_parseinfo(
-            ps, loc, 'Unknown command : ' + cmd))
-    # noinspection PyCallingNonCallable
-    errmsg = _cmdhandler_map[cmd](ps, loc, value)
-    if errmsg:
-        raise ParseError(_cm.create_parseinfo(
-            ps, loc, '[%s] %s' % (cmd, errmsg)))
-
-
-def _sect_parse_action(ps, loc, toks):
-    assert(3 == len(toks))
-    (sect_s, name, sect_e) = toks
-
-    cc = _cm.context
-    pi = _cm.create_parseinfo(ps, loc)
-    # check error cases.
-    thisdepth = len(sect_s)
-    if thisdepth != len(sect_e):
-        pi.set_current_tag('Incorrect section depth')
-        raise ParseError(pi)
-    if thisdepth > cc.sdepth + 1:
-        pi.set_current_tag('Section too nested')
-        raise ParseError(pi)
-    # move to parent section of this depth
-    while cc.sdepth >= thisdepth:
-        cc.spop()
-    # NOTE
-    # Section path is updated. So, re-create parseinfo here.
-    pi = _cm.create_parseinfo(ps, loc)
-    parentsect = cc.cws
-    if parentsect.is_readonly(name):
-        pi.set_current_tag('Section name(%s) already in use.' % name)
-        raise ParseError(pi)
-    elif not parentsect.is_section(name):
-        parentsect[name] = Sect(name)
-        parentsect.overlay_key_parseinfo(name, pi)
-    else:
-        # 'name' is existing-subsection.
-        # And now it is shown at config file
-        # So, it should be set as readonly
-        parentsect.set_readonly(name, False)
-        # Use latest(defined lastly) information
-        parentsect.overlay_key_parseinfo(name, pi)
-    P.d('Sect "%s" is added to Sect "%s"\n' % (name, parentsect.name))
-    cc.spush(parentsect[name])
-
-
 _KIMAP = {_KIMAN_CH: section.KIMAN,
           _KIFIN_CH: section.KIFIN,
           _KITMP_CH: section.KITMP}
 
 
-def _keyvalue_parse_action(ps, loc, toks):
-    assert(2 == len(toks)
-           or 3 == len(toks))
-    cc = _cm.context
-    k = toks[0]
-    assert len(k) > 0
-    kis = {
-        section.KIMAN: False,
-        section.KIFIN: False,
-        section.KITMP: False
-    }
+def _split_key_prefix(k):
+    """
+    :param k: (str) key token
+    :return: tuple(key name, key info attributes(int) of key prefixes)
+    """
+    kis = 0
     for prefix in _KIMAP.keys():
         if k[0] == prefix:
             k = k[1:]
-            kis[_KIMAP[prefix]] = True
-    op = toks[1]
-    if 2 == len(toks):
-        v = ''  # empty string by default
-    else:
-        v = toks[2]
-    s = cc.cws
-    P.d('Key "%s" is added to Sect "%s"\n' % (k, s.name))
-    pi = _cm.create_parseinfo(ps, loc)
-    # execute named replacement with current working section
-    try:
-        v = kvfmt.kvparse(v)
-        if op == ':=':
-            # Immediate non-recursive evaluation.
-            v = kvfmt.kveval_parsed_non_recursive(
-                cc.sroot, _cm.get_current_sect_path() + [k], v)
-            # update with evaluated value.
-        s[k] = v
-        s.overlay_key_parseinfo(k, pi)
-        for ki in kis:
-            s.set_ki(k, ki, kis[ki])
-    except KeyError as e:
-        pi.set_current_tag(str(e))
-        raise ParseError(pi)
+            kis |= _KIMAP[prefix]
+    return k, kis
 
 
 # ===============================
 # Constructs config file BNF form
 # ===============================
-def _build_recursive_descent_parser(vrfconf):
+def _word_key_restr(vrfconf):
+    """
+    :return: (str, str) regex for base token for name and key
+    """
+    if vrfconf:
+        wordrestr = r'[^\s]+'
+        keyrestr = wordrestr
+    else:
+        wordrestr = r'[a-zA-Z0-9_\-\.]+'
+        keyattr_prefix = '[\\' + _KIFIN_CH + '\\' + _KITMP_CH + ']'
+        keyrestr = keyattr_prefix + '?' + wordrestr
+    return wordrestr, keyrestr
+
+
+def _build_bnf(vrfconf, sect_action, cmd_action, keyvalue_action):
     ##########################################################################
     #
     # Implements BNF with pyparsing
     #
     ##########################################################################
-    # parsing config item is based on line-by-line parsing by default.
-    pp.ParserElement.setDefaultWhitespaceChars('\f\v\r')
-
     lnend = pp.Literal('\n').suppress()
     allchars = pp.CharsNotIn('\n')
     spacestr = r'[ \t]'
@@ -396,11 +357,7 @@ def _build_recursive_descent_parser(vrfconf):
     #
     # base token for name.
     #
-
-    if vrfconf:
-        wordrestr = r'[^\s]+'
-    else:
-        wordrestr = r'[a-zA-Z0-9_\-\.]+'
+    wordrestr, keyrestr = _word_key_restr(vrfconf)
     word = pp.Regex(wordrestr)
 
     #
@@ -428,11 +385,7 @@ def _build_recursive_descent_parser(vrfconf):
     #
     # key / value
     #
-    if vrfconf:
-        key = word
-    else:
-        keyattr_prefix = '[\\' + _KIFIN_CH + '\\' + _KITMP_CH + ']'
-        key = pp.Regex(keyattr_prefix + '?' + wordrestr)
+    key = pp.Regex(keyrestr)
 
     # non-comment spaces
     ncmtspsstr = r'(?:' + spacestr + r'(?!#))+'
@@ -467,104 +420,594 @@ def _build_recursive_descent_parser(vrfconf):
     # Define action functions
     #
     ##########################################################################
-    command.setParseAction(_cmd_parse_action)
-    sect.setParseAction(_sect_parse_action)
-    keyvalue.setParseAction(_keyvalue_parse_action)
+    command.setParseAction(cmd_action)
+    sect.setParseAction(sect_action)
+    keyvalue.setParseAction(keyvalue_action)
 
     return fullcfg
 
 
-_cpsr = _build_recursive_descent_parser(False)
-_vpsr = _build_recursive_descent_parser(True)
-_current_parser = None  # default
+# Default whitespace chars of pyparsing is process-global.
+_pp_lock = threading.Lock()
+
+
+def _build_recursive_descent_parser(vrfconf, sect_action, cmd_action,
+                                    keyvalue_action):
+    with _pp_lock:
+        wschars = pp.ParserElement.DEFAULT_WHITE_CHARS
+        # parsing config item is based on line-by-line parsing by default.
+        pp.ParserElement.setDefaultWhitespaceChars('\f\v\r')
+        try:
+            return _build_bnf(vrfconf, sect_action, cmd_action,
+                              keyvalue_action)
+        finally:
+            pp.ParserElement.setDefaultWhitespaceChars(wschars)
+
 
+def _build_line_parser(vrfconf, sect_action, cmd_action, keyvalue_action):
+    """
+    Build parser accepting same syntax with the one built by
+    '_build_recursive_descent_parser'.
+    """
+    wordrestr, keyrestr = _word_key_restr(vrfconf)
+    return lineparser.LineParser(wordrestr, keyrestr, _KICMD_CH,
+                                 sect_action,
+                                 cmd_action,
+                                 keyvalue_action)
 
-def _set_parser(psr):
-    global _current_parser
-    _current_parser = psr
 
+# Parsing engines
+ENGINE_PYPARSING = 'pyparsing'  # Recursive descent parser using pyparsing
+ENGINE_LINE = 'line'  # Hand-written line-oriented parser
 
-def _get_parser():
-    return _current_parser
+# engine -> function building parser
+_engines = {
+    ENGINE_PYPARSING: _build_recursive_descent_parser,
+    ENGINE_LINE: _build_line_parser
+}
 
 
-def _parse_conf(ps, loc, fconf):
+# ============================================================================
+#
+# Parser
+#
+# ============================================================================
+class Parser(object):
     """
-    :param ps: parse-string
-    :param loc: interesting/issued location
-    :param fconf: (str) abs-path for config file.
-    :return: (Context) context contains parse result.
+    Parser owns its parsing context and grammars. So, different parsers can
+    be used at different threads at the same time. But, a parser is used by
+    only one thread at a time.
     """
-    assert _is_abspath(fconf)
+    def __init__(self):
+        self._cm = ContextManager()
+        self._psrs = {}  # (engine, vrfconf) -> parser
+        self._psr = None  # parser currently used
+        self._lock = threading.RLock()
+        self._cancelled = False
 
-    # check recursive(cyclic) parsing
-    # This may be happened by including recursively
-    if None is not _cm.get_conf_context(fconf):
-        # cyclic parsing is detected.
-        raise ParseError(_cm.create_parseinfo(
-            ps, loc, 'Cyclic(Recursive) parsing is detected'))
+    def cancel(self):
+        """
+        Cancel parsing in progress - or next one if there is no parsing in
+        progress. It can be called at any thread. Cancelled parsing raises
+        errors.CancelledError before parsing next file or verifying. That
+        is, file being parsed isn't interrupted.
+        """
+        self._cancelled = True
+
+    def _check_cancelled(self):
+        if self._cancelled:
+            self._cancelled = False
+            raise CancelledError()
+
+    def _get_engine_parser(self, engine, vrfconf):
+        key = (engine, vrfconf)
+        psr = self._psrs.get(key)
+        if None is psr:
+            psr = _engines[engine](vrfconf,
+                                   self._sect_parse_action,
+                                   self._cmd_parse_action,
+                                   self._keyvalue_parse_action)
+            self._psrs[key] = psr
+        return psr
+
+    # ========================================================================
+    #
+    # Action functions
+    #
+    # ========================================================================
+    def _glob_include_files(self, v):
+        c = self._cm.context
+        pathvalue = v if _is_abspath(v) else os.path.join(c.cwd, v)
+        files = depsmod.glob_files(pathvalue)
+        c.deps.add_glob(pathvalue, files)
+        return files
+
+    def _merge_section(self, dst, src, ps, loc):
+        try:
+            dst.supdate(src)
+        except KeyError as e:
+            raise ParseError(self._cm.create_parseinfo(ps, loc, str(e)))
 
-    _cm.parse_start(ps, loc, fconf)
-    try:
-        with open(fconf, 'rb') as f:
-            content = f.read()
-
-        # change new line style : DOS -> UNIX
-        # noinspection PyUnresolvedReferences
-        content = str(content.decode('utf-8'))
-        content.replace('\r\n', '\n')
-        repldict = _cm.repldict
-        if repldict is not None:
+    def _memo_key(self, fconf):
+        return (fconf,
+                self._cm.vrfconf,
+                self._cm.repldict_key,
+                self._cm.track)
+
+    def _get_memoized_sect(self, ps, loc, key):
+        """
+        :return: (Sect) copy of memoized root section of included file.
+                 None if there is no usable memo.
+        """
+        e = self._cm.memo.get(key)
+        if None is e:
+            return None
+        c = self._cm.context
+        sectpath = c.sectpath
+        if (e.immeval
+                and e.sectpath != sectpath):
+            # Result of immediate evaluation depends on section path.
+            return None
+        for f in e.deps.files:
+            if None is not self._cm.get_conf_context(f):
+                # Cyclic including. Parsing again reports it.
+                return None
+        # Same with 'parse_start'.
+        c.setloc(ps, loc)
+        prefix = c.stk + (c.pos,)
+        subs = e.sroot.scopy()
+        cache = {}
+        subs.replace_parseinfo(lambda pi: pi.rebase(
+            e.depth, prefix, len(e.sectpath), sectpath, cache))
+        c.deps.update(e.deps)
+        return subs
+
+    def _include_sect(self, ps, loc, key):
+        """
+        :return: (Sect) root section of included file.
+        """
+        subs = self._get_memoized_sect(ps, loc, key)
+        if None is subs:
+            depth = len(self._cm.cstk)
+            sectpath = self._cm.context.sectpath
+            nimmeval = self._cm.nimmeval
+            ctxt = self._parse_conf(ps, loc, key[0])
+            subs = ctxt.sroot
+            self._cm.memo.put(key, _MemoEntry(subs, depth, sectpath,
+                                              nimmeval != self._cm.nimmeval,
+                                              ctxt.deps))
+        return subs
+
+    def _parse_include(self, fconf, stkfiles, sectpath, repldict, vrfconf,
+                       lazy, track, engine):
+        """
+        Parse included file with stub of include stack. So, parse infos of
+        result should be rebased like memoized one.
+        :return: (_MemoEntry) None if parsing fails.
+        """
+        self._cm.repldict = repldict
+        self._cm.repldict_key = depsmod.dict_key(repldict)
+        self._cm.vrfconf = vrfconf
+        self._cm.lazy = lazy
+        self._cm.track = track
+        self._cm.engine = engine
+        self._cm.memo = IncludeMemo()
+        self._psr = self._get_engine_parser(engine, vrfconf)
+        stk = ()
+        for f in stkfiles:
+            c = Context(f, stk, track=track)
+            self._cm.cstk.append(c)
+            stk = stk + (c.pos,)
+        for name in sectpath:
+            self._cm.context.spush(Sect(name, track))
+        try:
+            ctxt = self._parse_conf(None, -1, fconf)
+        except Exception as e:
+            P.d('Fail to parse at pool: %s: %s' % (fconf, str(e)))
+            return None
+        return _MemoEntry(ctxt.sroot, len(stkfiles), tuple(sectpath),
+                          0 != self._cm.nimmeval, ctxt.deps)
+
+    def _prefetch_include_sects(self, keys):
+        """
+        Parse included files - not memoized yet - in parallel, and memoize
+        them.
+        """
+        keys = [k for k in keys if None is self._cm.memo.get(k)]
+        if len(keys) < 2:
+            return
+        stkfiles = [c.file for c in self._cm.cstk]
+        sectpath = self._cm.get_current_sect_path()
+        cm = self._cm
+        args = [(k[0], stkfiles, sectpath, cm.repldict, cm.vrfconf, cm.lazy,
+                 cm.track, cm.engine) for k in keys]
+        try:
+            entries = self._cm.pool.map(_parse_include_task, args)
+        except Exception as e:
+            # Files are parsed in sequence.
+            P.w('Fail to parse included files in parallel: %s' % str(e))
+            return
+        for key, e in zip(keys, entries):
+            if None is not e:
+                self._cm.memo.put(key, e)
+
+    def _include_files(self, ps, loc, v, writable):
+        files = self._glob_include_files(v)
+        if 0 == len(files):
+            raise FileIOError(self._cm.create_parseinfo(
+                None, -1, 'Fail to access config file'))
+        cws = self._cm.context.cws
+        keys = tuple([self._memo_key(f) for f in sorted(files)])
+        if None is not self._cm.pool:
+            self._prefetch_include_sects(keys)
+        if (writable
+                and not self._cm.track
+                and None is not self._cm.last_merge
+                and self._cm.last_merge[0] is cws
+                and self._cm.last_merge[1:] == (keys, True)):
+            # Inheriting same files again just after inheriting them, is
+            # idempotent - if there is no final key. If parse info history
+            # is tracked, it isn't skipped to record the overlay.
+            entries = [self._cm.memo.get(k) for k in keys]
+            if all([None is not e and not e.has_final for e in entries]):
+                P.d('Skip idempotent inheriting: %s' % v)
+                return
+        for key in keys:
+            subs = self._include_sect(ps, loc, key)
+            if writable:
+                subs.set_writable()
+            else:
+                subs.set_readonly()
+            self._merge_section(cws, subs, ps, loc)
+        self._cm.last_merge = (cws, keys, writable)
+
+    # return None if success, otherwise error message.
+    def _cmdhandle_inherit(self, ps, loc, v):
+        """
+        Inherit from external config file. Overwriting included keys are
+        allowed.
+        """
+        self._include_files(ps, loc, v, True)
+
+    def _cmdhandle_include(self, ps, loc, v):
+        """
+        Include external config file. Overwriting included keys are NOT
+        allowed.
+        """
+        self._include_files(ps, loc, v, False)
+
+    def _cmdhandle_rmkeys(self, ps, loc, v):
+        """
+        Remove keys from current working section.
+        """
+        cc = self._cm.context
+        s = cc.cws
+        for key in v.split():
+            if key in s:
+                del s[key]
+            else:
+                raise ParseError(self._cm.create_parseinfo(
+                    ps, loc, 'Unknown key : ' + key))
+
+    _cmdhandler_map = {
+        # 'inherit' and 'include' are basically same - including external
+        # config. Difference is that caller can override section key created
+        # by 'inherit'. But, in case of 'include' this case raise
+        # 'DuplicatedKey' error.
+        'inherit': _cmdhandle_inherit,
+        'include': _cmdhandle_include,
+        # Supporing 'rmkeys' commands may break 'key overwriting protection'.
+        # Therefore, 'rmkeys' command is disabled.
+        # 'rmkeys': _cmdhandle_rmkeys
+    }
+
+    def _cmd_parse_action(self, ps, loc, toks):
+        assert(2 == len(toks))
+        cmd = toks[0].strip()
+        value = toks[1].strip()
+        if cmd not in ('inherit', 'include'):
+            self._cm.last_merge = None
+        if cmd not in self._cmdhandler_map:
+            raise ParseError(self._cm.create_parseinfo(
+                ps, loc, 'Unknown command : ' + cmd))
+        # noinspection PyCallingNonCallable
+        errmsg = self._cmdhandler_map[cmd](self, ps, loc, value)
+        if errmsg:
+            raise ParseError(self._cm.create_parseinfo(
+                ps, loc, '[%s] %s' % (cmd, errmsg)))
+
+    def _sect_parse_action(self, ps, loc, toks):
+        assert(3 == len(toks))
+        (sect_s, name, sect_e) = toks
+
+        self._cm.last_merge = None
+        cc = self._cm.context
+        # check error cases.
+        thisdepth = len(sect_s)
+        if thisdepth != len(sect_e):
+            raise ParseError(self._cm.create_parseinfo(
+                ps, loc, 'Incorrect section depth'))
+        if thisdepth > cc.sdepth + 1:
+            raise ParseError(self._cm.create_parseinfo(
+                ps, loc, 'Section too nested'))
+        # move to parent section of this depth
+        while cc.sdepth >= thisdepth:
+            cc.spop()
+        # NOTE
+        # Section path is updated. So, parseinfo is created after this.
+        parentsect = cc.cws
+        if parentsect.is_readonly(name):
+            raise ParseError(self._cm.create_parseinfo(
+                ps, loc, 'Section name(%s) already in use.' % name))
+        elif not parentsect.is_section(name):
+            parentsect[name] = Sect(name, self._cm.track)
+        else:
+            # 'name' is existing-subsection.
+            # And now it is shown at config file
+            # So, it should be set as readonly
+            parentsect.set_readonly(name, False)
+        # Use latest(defined lastly) information
+        parentsect.overlay_key_parseinfo(
+            name, self._cm.create_parseinfo(ps, loc))
+        P.d('Sect "%s" is added to Sect "%s"\n' % (name, parentsect.name))
+        cc.spush(parentsect[name])
+
+    def _keyvalue_parse_action(self, ps, loc, toks):
+        assert(2 == len(toks)
+               or 3 == len(toks))
+        self._cm.last_merge = None
+        cc = self._cm.context
+        assert len(toks[0]) > 0
+        # kis: key info attributes to be set
+        k, kis = _split_key_prefix(toks[0])
+        op = toks[1]
+        if 2 == len(toks):
+            v = ''  # empty string by default
+        else:
+            v = toks[2]
+        s = cc.cws
+        P.d('Key "%s" is added to Sect "%s"\n' % (k, s.name))
+        # Parse info is kept even if it's not tracked, for errors while
+        # loading. See 'parse_conf'.
+        pi = self._cm.create_parseinfo(ps, loc)
+        # execute named replacement with current working section
+        try:
+            v = kvfmt.kvparse(v)
+            if op == ':=':
+                self._cm.nimmeval += 1
+                # Immediate non-recursive evaluation.
+                v = kvfmt.kveval_parsed_non_recursive(
+                    cc.sroot, self._cm.get_current_sect_path() + [k], v)
+                # update with evaluated value.
+            s[k] = v
+            s.overlay_key_parseinfo(k, pi)
+            if kis:
+                s.set_ki(k, kis, True)
+        except KeyError as e:
+            pi.set_current_tag(str(e))
+            raise ParseError(pi)
+
+    def _parse_conf(self, ps, loc, fconf):
+        """
+        :param ps: parse-string
+        :param loc: interesting/issued location
+        :param fconf: (str) abs-path for config file.
+        :return: (Context) context contains parse result.
+        """
+        assert _is_abspath(fconf)
+        self._check_cancelled()
+
+        # check recursive(cyclic) parsing
+        # This may be happened by including recursively
+        if None is not self._cm.get_conf_context(fconf):
+            # cyclic parsing is detected.
+            raise ParseError(self._cm.create_parseinfo(
+                ps, loc, 'Cyclic(Recursive) parsing is detected'))
+
+        self._cm.parse_start(ps, loc, fconf)
+        done = False
+        try:
+            with open(fconf, 'rb') as f:
+                content = f.read()
+            self._cm.context.deps.add_file(fconf, content)
+
+            # change new line style : DOS -> UNIX
+            # noinspection PyUnresolvedReferences
+            content = str(content.decode('utf-8'))
+            content.replace('\r\n', '\n')
+            repldict = self._cm.repldict
+            if repldict is not None:
+                try:
+                    content = content % repldict
+                except KeyError as e:
+                    msg = ('Unknown symbol at named-replacement: %%(%s)s'
+                           % str(e))
+                    raise ParseError(self._cm.create_parseinfo(None, 0, msg))
+            self._psr.parseString(content, True)
+            done = True
+            return self._cm.context
+        except IOError:
+            raise FileIOError(self._cm.create_parseinfo(
+                None, -1, 'Fail to access config file'))
+        except (pp.ParseBaseException, lineparser.LineParseError) as e:
+            # Ugly hack.
+            # But, this is better response.
+            if e.msg == 'Expected end of text':
+                e.msg = 'Syntax error'
+            raise ParseError(self._cm.create_parseinfo(e.pstr, e.loc, e.msg))
+        finally:
+            self._cm.parse_end(not done)
+
+    def _parse_root(self, fpath, repldict, vrfconf, engine, deps):
+        """
+        Parse config or verifier file as root.
+        :return: (Context) context contains parse result.
+        """
+        self._cm.last_merge = None
+        self._cm.repldict = repldict
+        self._cm.repldict_key = depsmod.dict_key(repldict)
+        self._cm.vrfconf = vrfconf
+        self._cm.engine = engine
+        self._psr = self._get_engine_parser(engine, vrfconf)
+        ctxt = self._parse_conf(None, -1, os.path.abspath(fpath))
+        if None is not deps:
+            deps.update(ctxt.deps)
+        return ctxt
+
+    def parse_verifier(self, fverifier, vrfdict, vrf_ruledict=None,
+                       deps=None, memo=None, engine=ENGINE_PYPARSING):
+        """
+        Parse verifier file and gives compiled verifier as result.
+        :param fverifier: verifier file path.
+        :param vrfdict: verifier dictionary
+        :param vrf_ruledict: See 'parse_conf'
+        :param deps: See 'parse_conf'
+        :param memo: See 'parse_conf'
+        :param engine: See 'parse_conf'
+        :return: (verifier.Verifier) verifier.
+        """
+        with self._lock:
+            self._cm.memo = IncludeMemo() if None is memo else memo
+            # Parse info of verifier is used at verification errors.
+            self._cm.track = True
+            vdeps = depsmod.Deps()
             try:
-                content = content % repldict
-            except KeyError as e:
-                msg = 'Unknown symbol at named-replacement: %%(%s)s' % str(e)
-                raise ParseError(_cm.create_parseinfo(None, 0, msg))
-        _get_parser().parseString(content, True)
-        return _cm.context
-    except IOError:
-        raise FileIOError(_cm.create_parseinfo(
-            None, -1, 'Fail to access config file'))
-    except pp.ParseBaseException as e:
-        # Ugly hack.
-        # But, this is better response.
-        if e.msg == 'Expected end of text':
-            e.msg = 'Syntax error'
-        raise ParseError(_cm.create_parseinfo(e.pstr, e.loc, e.msg))
-    finally:
-        _cm.parse_end()
+                ctxt = self._parse_root(fverifier, vrfdict, True, engine,
+                                        vdeps)
+            finally:
+                self._psr = None
+                self._cm.memo = None
+        if None is not deps:
+            deps.update(vdeps)
+        return verifier.Verifier(ctxt.sroot, ctxt.file, vrf_ruledict, vdeps)
+
+    def _raise_eager_error(self, e, fconf, confdict, engine):
+        """
+        Error of lazy mode may be different from the one of eager mode -
+        ex. errors of included files are not raised when they are included.
+        So, config is parsed again eagerly to raise the error eager mode
+        raises. 'e' is raised if it succeeds.
+        :param e: (BaseError) error raised in lazy mode.
+        """
+        with self._lock:
+            self._cm.lazy = False
+            # Memoized sections of lazy mode are not used.
+            self._cm.memo = IncludeMemo()
+            self._cm.pool = None
+            try:
+                self._parse_root(fconf, confdict, False, engine, None)
+            finally:
+                self._psr = None
+                self._cm.memo = None
+        raise e
+
+    def parse_conf(self, fconf, fverifier, confdict, vrfdict,
+                   vrf_ruledict=None, deps=None, memo=None,
+                   engine=ENGINE_PYPARSING, lazy=False, vrf_pool=None,
+                   include_pool=None, track_provenance=True):
+        """
+        Parse config file and gives root section as result.
+        :param fconf: config file path
+        :param fverifier: verifier file path or verifier.Verifier from
+                          'parse_verifier'. None is allowed.
+        :param confdict: configuration dictionary
+        :param vrfdict: verifier dictionary. Not used if 'fverifier' is
+                        verifier.Verifier.
+        :param vrf_ruledict: (dict) Custom symbols(including functions) to be
+                             used as global dict to eval verifier rule. Not
+                             used if 'fverifier' is verifier.Verifier.
+        :param deps: (deps.Deps) If not None, files read while parsing config
+                     and verifier are recorded to it.
+        :param memo: (IncludeMemo) memo of parsed include files. It should be
+                     created with 'validate=True' to share it among several
+                     loads. None means 'memo only for this parsing'.
+        :param engine: (str) parsing engine. One of ENGINE_XXX.
+        :param lazy: (bool) Evaluate key values of config when they are
+                     accessed first time. Evaluation errors are raised at
+                     that time. See section.Sect.evaluate_all(). If loading
+                     fails, config is parsed again eagerly to raise the
+                     error eager mode raises.
+                     Verification evaluates all values of verified config.
+        :param vrf_pool: (multiprocessing.pool.Pool or ThreadPool) pool used
+                         to verify top-level sections in parallel.
+                         See verifier.Verifier.verify().
+        :param include_pool: (multiprocessing.pool.Pool) process pool used to
+                             parse files expanded from glob - ex.
+                             '@include (conf.d/*)' - in parallel. Result and
+                             errors are same with the ones of parsing in
+                             sequence.
+        :param track_provenance: (bool) False means parse info history of
+                                 config keys are not recorded - they are
+                                 empty. It saves memory. Only the last
+                                 position of each key is kept while loading.
+                                 So, errors raised while loading - ex.
+                                 evaluation and verification errors - still
+                                 have positions of the keys. But errors of
+                                 lazy evaluation after loading don't.
+        :return: (section.Sect) root section.
+        """
+        memo = IncludeMemo() if None is memo else memo
+        with self._lock:
+            self._cm.memo = memo
+            self._cm.lazy = lazy
+            self._cm.track = track_provenance
+            self._cm.pool = include_pool
+            try:
+                ctxt = self._parse_root(fconf, confdict, False, engine, deps)
+            except BaseError as e:
+                if lazy and not isinstance(e, CancelledError):
+                    self._raise_eager_error(e, fconf, confdict, engine)
+                raise
+            finally:
+                self._psr = None
+                self._cm.memo = None
+                self._cm.pool = None
+            if (None is not fverifier
+                    and not isinstance(fverifier, verifier.Verifier)):
+                fverifier = self.parse_verifier(fverifier, vrfdict,
+                                                vrf_ruledict, deps, memo,
+                                                engine)
+        csct = ctxt.sroot  # config section
+        if None is not fverifier:
+            self._check_cancelled()
+            try:
+                fverifier.verify(csct, ctxt.file, vrf_pool)
+            except EvalError as e:
+                if lazy:
+                    self._raise_eager_error(e, fconf, confdict, engine)
+                raise
+        if not track_provenance:
+            csct.clear_parseinfo()
+        return csct
 
 
-def parse_conf(fconf, fverifier, confdict, vrfdict, vrf_ruledict=None):
+def _parse_include_task(args):
     """
-    Parse config file and gives root section as result.
-    :param fconf: config file path
-    :param fverifier: verifier file path. None is allowed.
-    :param confdict: configuration dictionary
-    :param vrfdict: verifier dictionary
-    :param vrf_ruledict: (dict) Custom symbols(including functions) to be used
-                          as global dict to eval verifier rule.
-    :return: (section.Sect) root section.
+    Task parsing included file at process pool.
+    :return: (_MemoEntry) None if parsing fails. Failed file is parsed again
+             in sequence to raise error with correct include stack.
     """
-    fconf = os.path.abspath(fconf)
-    _cm.repldict = confdict
-    _set_parser(_cpsr)
-    ctxt = _parse_conf(None, -1, fconf)
-    csct = ctxt.sroot  # config section
-    cfconf = ctxt.file
-    vsct = None  # verifier section
-    vfconf = None
-    if None is not fverifier:
-        fverifier = os.path.abspath(fverifier)
-        _cm.repldict = vrfdict
-        _set_parser(_vpsr)
-        ctxt = _parse_conf(None, -1, fverifier)
-        vsct = ctxt.sroot
-        vfconf = ctxt.file
-    verifier.verify_conf(csct, cfconf, vsct, vfconf,
-                         {} if vrf_ruledict is None else vrf_ruledict)
-    _set_parser(None)
-    return csct
+    return Parser()._parse_include(*args)
+
+
+def parse_verifier(fverifier, vrfdict, vrf_ruledict=None,
+                   deps=None, memo=None, engine=ENGINE_PYPARSING):
+    """
+    Parse verifier file with new parser. See Parser.parse_verifier().
+    """
+    return Parser().parse_verifier(fverifier, vrfdict, vrf_ruledict, deps,
+                                   memo, engine)
+
+
+def parse_conf(fconf, fverifier, confdict, vrfdict, vrf_ruledict=None,
+               deps=None, memo=None, engine=ENGINE_PYPARSING, lazy=False,
+               vrf_pool=None, include_pool=None, track_provenance=True):
+    """
+    Parse config file with new parser. See Parser.parse_conf().
+    """
+    return Parser().parse_conf(fconf, fverifier, confdict, vrfdict,
+                               vrf_ruledict, deps, memo, engine, lazy,
+                               vrf_pool, include_pool, track_provenance)
 
 
 # ============================================================================
@@ -576,8 +1019,145 @@ def _cust_vrf_large_int_rule(val):
     return int(val) > 1000
 
 
+def test_include_memo():
+    import shutil
+    import tempfile
+
+    tmpd = tempfile.mkdtemp()
+    try:
+        fconf = os.path.join(tmpd, 'conf')
+        finc = os.path.join(tmpd, 'inc')
+        with open(fconf, 'w') as f:
+            f.write('[ s0 ]\n@include (inc)\n[ s1 ]\n@include (inc)\n')
+        with open(finc, 'w') as f:
+            f.write('key = value0\n')
+        memo = IncludeMemo(True)
+        s = parse_conf(fconf, None, None, None, None, None, memo)
+        assert 'value0' == s['s0']['key'] == s['s1']['key']
+        assert 1 == len(memo.entries)
+        # Include back trace should be the one of each include command.
+        pi0 = s['s0'].get_key_parseinfo_history('key').cur_pi()
+        pi1 = s['s1'].get_key_parseinfo_history('key').cur_pi()
+        assert 2 == pi0.prpo.get(0).lineno
+        assert 4 == pi1.prpo.get(0).lineno
+        assert ['s0'] == pi0.sectpath.path
+        assert ['s1'] == pi1.sectpath.path
+
+        with open(finc, 'w') as f:
+            f.write('key = value1\n')
+        s = parse_conf(fconf, None, None, None, None, None, memo)
+        assert 'value1' == s['s0']['key'] == s['s1']['key']
+    finally:
+        shutil.rmtree(tmpd)
+
+
+def test_track_provenance():
+    from errors import EvalError, VerificationError
+
+    testdir = os.path.abspath('tests')
+    fconf = os.path.join(testdir, 'conf10')
+    s0 = parse_conf(fconf, None, None, None)
+    s1 = parse_conf(fconf, None, None, None, track_provenance=False)
+    assert str(s0) == str(s1)
+    assert 0 < len(s0.get_key_parseinfo_history('key0').pis)
+    assert 0 == len(s1.get_key_parseinfo_history('key0').pis)
+    # Parse errors have same positions.
+    errs = []
+    for track in (True, False):
+        try:
+            parse_conf(os.path.join(testdir, 'conf10e00'), None, None, None,
+                       track_provenance=track)
+            assert False
+        except ParseError as e:
+            errs.append(str(e))
+    assert errs[0] == errs[1]
+    # Errors raised while loading have positions of keys, too.
+    for fname, fvrf, line, lazy in (('conf21e01', None, 4, False),
+                                    ('conf13e00', 'conf13e00.vrf', 6, False),
+                                    ('conf13e00', 'conf13e00.vrf', 6, True)):
+        fconf = os.path.join(testdir, fname)
+        fvrf = None if None is fvrf else os.path.join(testdir, fvrf)
+        errs = []
+        for track in (True, False):
+            try:
+                parse_conf(fconf, fvrf, {}, {}, lazy=lazy,
+                           track_provenance=track)
+                assert False
+            except (EvalError, VerificationError) as e:
+                assert '%s (#line: %d,' % (fconf, line) in str(e)
+                errs.append(str(e))
+        assert errs[0] == errs[1]
+    # Kept positions are released after loading.
+    assert 0 == len(s1._pih)
+
+
+def test_threads():
+    import threading
+
+    # Configs are parsed at several threads at the same time.
+    testdir = os.path.abspath('tests')
+    fconfs = [os.path.join(testdir, name)
+              for name in sorted(os.listdir(testdir))
+              if (os.path.exists(os.path.join(testdir, name + '.ok'))
+                  and not os.path.exists(os.path.join(testdir,
+                                                      name + '.vrf')))]
+    jobs = [(f, engine) for f in fconfs
+            for engine in (ENGINE_PYPARSING, ENGINE_LINE)]
+
+    def parse(psr, fconf, engine):
+        confdict = {'__filename__': os.path.basename(fconf)}
+        return str(psr.parse_conf(fconf, None, confdict, None,
+                                  engine=engine))
+
+    expected = [parse(Parser(), f, engine) for f, engine in jobs]
+    results = [None] * len(jobs)
+
+    def run(i):
+        psr = Parser()
+        for _ in range(5):
+            results[i] = parse(psr, *jobs[i])
+
+    threads = [threading.Thread(target=run, args=(i,))
+               for i in range(len(jobs))]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert expected == results
+
+
+def _test_worker_verifiers(_):
+    return list(verifier._verifiers)
+
+
+def test_vrf_pool():
+    import multiprocessing
+    from multiprocessing.pool import ThreadPool
+
+    testdir = os.path.abspath('tests')
+    fconf = os.path.join(testdir, 'conf15')
+    confdict = {'__filename__': 'conf15'}
+    vrf = parse_verifier(os.path.join(testdir, 'conf15.vrf'),
+                         {'__filename__': 'conf15.vrf'})
+    expected = str(parse_conf(fconf, vrf, confdict, None))
+    for pool in (multiprocessing.Pool(1), ThreadPool(2)):
+        try:
+            for _ in range(2):
+                assert expected == str(parse_conf(fconf, vrf, confdict, None,
+                                                  vrf_pool=pool))
+            if not isinstance(pool, ThreadPool):
+                # Verifier is unpickled - rules are compiled - only once at
+                # worker process.
+                assert ([[vrf.id]]
+                        == pool.map(_test_worker_verifiers, [0]))
+        finally:
+            pool.close()
+            pool.join()
+
+
 def test():
     import os
+    import multiprocessing
 
     def check_data(datastr, datafile):
         with open(datafile, 'rb') as fh:
@@ -588,7 +1168,9 @@ def test():
                 % (datafile, datastr))
             assert False
 
-    def test_file_(fconf, fverifier, expectok):
+    def test_file_(fconf, fverifier, expectok, engine, lazy):
+        # In lazy mode, compiled verifier, parallel verification and
+        # parallel parsing are also tested.
         # cfg.setDebug()
         # print('Testing : %s\n' % fconf)
         evalrule = {
@@ -605,7 +1187,14 @@ def test():
                 vrfdict = {
                     '__filename__': os.path.basename(fverifier)
                 }
-            sroot = parse_conf(fconf, fverifier, confdict, vrfdict, evalrule)
+            if lazy and fverifier is not None:
+                fverifier = parse_verifier(fverifier, vrfdict, evalrule,
+                                           engine=engine)
+            sroot = parse_conf(fconf, fverifier, confdict, vrfdict, evalrule,
+                               engine=engine, lazy=lazy,
+                               vrf_pool=pool if lazy else None,
+                               include_pool=pool if lazy else None)
+            sroot.evaluate_all()
             if not expectok:
                 P.e('Failure is expected. But success! : %s\n' % fconf)
                 assert False
@@ -619,8 +1208,16 @@ def test():
             if expectok:
                 P.e('Fail parse\n%s\n' % fconf)
                 raise e
-
-    def test_file(fconf):
+            if lazy:
+                # Same error with eager mode.
+                try:
+                    parse_conf(fconf, fverifier, confdict, vrfdict,
+                               evalrule, engine=engine)
+                    assert False
+                except BaseError as ee:
+                    assert str(ee) == str(e)
+
+    def test_file(fconf, engine, lazy):
         fconf = os.path.abspath(fconf)
         okdata_file = fconf + '.ok'
         nokdata_file = fconf + '.nok'
@@ -628,13 +1225,13 @@ def test():
         if not os.path.exists(vrffile):
             vrffile = None
         expectok = not os.path.exists(nokdata_file)
-        sroot = test_file_(fconf, vrffile, expectok)
+        sroot = test_file_(fconf, vrffile, expectok, engine, lazy)
         # print(str(sroot))
         if expectok and os.path.exists(okdata_file):
             check_data(str(sroot), okdata_file)
 
     # noinspection PyShadowingNames
-    def test_dir(testdir):
+    def test_dir(testdir, engine, lazy):
         #
         # Test with given test samples
         #
@@ -644,25 +1241,38 @@ def test():
         for name in files:
             f = os.path.join(testdir, name)
             if os.path.isdir(f):
-                test_dir(f)
+                test_dir(f, engine, lazy)
             elif os.path.isfile(f) \
                     and (name.startswith('conf')
                          and not name.endswith('.ok')
                          and not name.endswith('.nok')
                          and not name.endswith('.vrf')):
-                test_file(f)
+                test_file(f, engine, lazy)
 
+    engines = (ENGINE_PYPARSING, ENGINE_LINE)
+    pool = None
     if len(sys.argv) > 1:
         # print('######## TEST WITH EXTERNAL SAMPLES ########\n')
         for f in sys.argv[1:]:
-            if os.path.isdir(f):
-                test_dir(f)
-            elif os.path.isfile(f):
-                test_file(f)
-            else:
-                print('Invalid file path(Skipped) : %s\n' % f)
+            for engine in engines:
+                if os.path.isdir(f):
+                    test_dir(f, engine, False)
+                elif os.path.isfile(f):
+                    test_file(f, engine, False)
+                else:
+                    print('Invalid file path(Skipped) : %s\n' % f)
     else:
-        test_dir('tests')
+        for engine in engines:
+            test_dir('tests', engine, False)
+        pool = multiprocessing.Pool(2)
+        try:
+            test_dir('tests', ENGINE_LINE, True)
+        finally:
+            pool.terminate()
+        test_include_memo()
+        test_track_provenance()
+        test_threads()
+        test_vrf_pool()
 
 
 # ============================================================================
@@ -39,40 +39,108 @@ from __future__ import print_function
 import logger
 
 from datastruct import OrderedDict
-from parseinfo import ParseInfoHistory
+from parseinfo import ParseInfo, ParseInfoHistory
 
 P = logger.P(__name__)
 # P.set_level(P.VERBOSE)
 P.set_level(P.ERROR)
 
 
-# Key info attribute
-_KIWR = 'wr'  # writable
-_KIPIH = 'pih'  # key parsing info history
+# Key info attribute flags
+_KIWR = 0x1  # writable
 
 # Public ki
-KIFIN = 'fin'  # final
-KITMP = 'tmp'  # temp key
-KIMAN = 'man'  # mandatory
+KIFIN = 0x2  # final
+KITMP = 0x4  # temp key
+KIMAN = 0x8  # mandatory
+
+KP_DELIMITER = ':'  # Key Path Delimiter
+
+_NOKEY = object()
+
+
+class _KPIndex(object):
+    """
+    Key path index of a section. It is updated whenever sections under the
+    section are changed.
+    """
+    __slots__ = ('idx',)
+
+    def __init__(self):
+        # key path -> tuple(parent section, key)
+        self.idx = {}
+
+
+class LazyValue(object):
+    """
+    Key value evaluated when it is accessed first time.
+    Evaluated value - returned by 'resolve()' of subclass - replaces this
+    object at the section. See kvfmt._LazyKValue.
+    """
+    __slots__ = ()
 
 
 class Sect(OrderedDict):
-    def __init__(self, name):
+    def __init__(self, name, track_pi=True):
+        """
+        :param name: (str) section name
+        :param track_pi: (bool) False means parse info history of keys are
+                         not recorded. Only the last parse info of each key
+                         is kept until 'clear_parseinfo', to report errors
+                         while loading.
+        """
         OrderedDict.__init__(self)
         self.name = name
-        # key infomation
+        self.track_pi = track_pi
+        # key infomation. key -> flags of key info attributes.
         self._ki = {}
+        # key -> (ParseInfoHistory). If 'track_pi' is False, key -> (ParseInfo)
+        # the last parse info.
+        self._pih = {}
+        # (_KPIndex) key path index of this section. See '_kp_index'.
+        self._kpidx = None
+        # list(tuple(_KPIndex, key path prefix)) key path indexes having
+        # keys of this section. None if there is no index.
+        self._kprefs = None
+
+    def __reduce__(self):
+        fn, args, state = OrderedDict.__reduce__(self)
+        if (None is not self._kpidx
+                or None is not self._kprefs):
+            # Key path index is built again when it is used.
+            d = state[1].copy()
+            d['_kpidx'] = d['_kprefs'] = None
+            state = (state[0], d)
+        return fn, args, state
+
+    def __getitem__(self, k):
+        v = dict.__getitem__(self, k)
+        if isinstance(v, LazyValue):
+            v = v.resolve()
+            dict.__setitem__(self, k, v)
+        return v
+
+    def get_raw(self, k):
+        """
+        Get key value without evaluating LazyValue.
+        """
+        return dict.__getitem__(self, k)
 
     def __setitem__(self, k, v):
         if self.is_readonly(k):
             P.d('Sect(%s): keyprop: %s' % (self.name, str(self._ki)))
             raise KeyError('Key(%s) is NOT writable' % k)
-        if k not in self._ki:
-            self._ki[k] = Sect._create_ki()
-        else:
-            Sect._init_ki_vals(self._ki[k])
+        if self.track_pi:
+            if k not in self._pih:
+                self._pih[k] = ParseInfoHistory()
+        elif self._pih:
+            # Parse info of old value
+            self._pih.pop(k, None)
+        if None is not self._kprefs:
+            self._kp_set(k, v)
+        # All attributes are cleared. So, key is read-only.
+        self._ki[k] = 0
         OrderedDict.__setitem__(self, k, v)
-        self._setro(k)
 
     def force_setitem(self, k, v):
         """\
@@ -80,41 +148,67 @@ class Sect(OrderedDict):
         This is very dangerous function(may break internal data-relation).
         So, if you are not sure, DO NOT USE this.
         """
+        if (None is not self._kprefs
+                and (isinstance(v, Sect)
+                     or isinstance(dict.get(self, k), Sect))):
+            self._kp_set(k, v)
         dict.__setitem__(self, k, v)
 
     def __delitem__(self, k):
         self._ki.pop(k, None)
+        self._pih.pop(k, None)
+        if None is not self._kprefs:
+            self._kp_del(k)
         OrderedDict.__delitem__(self, k)
 
-    @staticmethod
-    def _init_ki_vals(ki):
-        ki.update({
-            _KIWR: False,
-            KIMAN: False,
-            KIFIN: False,
-            KITMP: False,
-        })
+    def clear(self):
+        self._ki.clear()
+        self._pih.clear()
+        if None is not self._kprefs:
+            for k in self:
+                self._kp_del(k)
+        OrderedDict.clear(self)
 
-    @staticmethod
-    def _create_ki():
-        ki = dict()
-        Sect._init_ki_vals(ki)
-        ki[_KIPIH] = ParseInfoHistory()
-        return ki
-
-    def _overlay_ki(self, k, other_ki):
-        pih = self._ki[k][_KIPIH]
-        self._ki[k].update(other_ki)
-        pih.add_overlay_history(other_ki[_KIPIH])
-        self._ki[k][_KIPIH] = pih
+    def _copy_ki(self, k, other):
+        """
+        Copy key info of 'other' - key info of 'other' is not shared.
+        """
+        # noinspection PyProtectedMember
+        self._ki[k] = other._ki[k]
+        # noinspection PyProtectedMember
+        opih = other._pih.get(k)
+        if None is opih:
+            self._pih.pop(k, None)
+        elif isinstance(opih, ParseInfo):
+            self._pih[k] = opih
+        else:
+            pih = ParseInfoHistory()
+            pih.add_overlay_history(opih)
+            self._pih[k] = pih
+
+    def _overlay_ki(self, k, other):
+        # noinspection PyProtectedMember
+        self._ki[k] = other._ki[k]
+        pih = self._pih.get(k)
+        # noinspection PyProtectedMember
+        opih = other._pih.get(k)
+        if None is opih:
+            return
+        if isinstance(opih, ParseInfo):
+            if None is pih or isinstance(pih, ParseInfo):
+                self._pih[k] = opih
+            else:
+                pih.add_overlay_pi(opih)
+        elif isinstance(pih, ParseInfoHistory):
+            pih.add_overlay_history(opih)
 
     def _setro(self, k):
         P.d('%s:%s set to RO' % (self.name, k))
-        self._ki[k][_KIWR] = False
+        self._ki[k] &= ~_KIWR
 
     def _setrw(self, k):
         P.d('%s:%s set to RW' % (self.name, k))
-        self._ki[k][_KIWR] = True
+        self._ki[k] |= _KIWR
 
     def set_writable(self, key=None, recursive=True):
         """
@@ -125,10 +219,10 @@ class Sect(OrderedDict):
                     'None' for 'all-keys are writable'
         :param recursive:
         """
-        ks = [key] if key else self.ks
+        ks = [key] if key else self
         for k in ks:
             if (recursive
-                    and isinstance(self[k], Sect)):
+                    and isinstance(self.get_raw(k), Sect)):
                 self[k].set_writable(None)
             self._setrw(k)
 
@@ -140,41 +234,49 @@ class Sect(OrderedDict):
                     'None' for 'all-keys are read-only'
         :param recursive:
         """
-        ks = [key] if key else self.ks
+        ks = [key] if key else self
         for k in ks:
-            if recursive and isinstance(self[k], Sect):
+            if recursive and isinstance(self.get_raw(k), Sect):
                 self[k].set_readonly(None)
             self._setro(k)
 
     def is_readonly(self, k):
         if k not in self:
             return False
+        ki = self._ki[k]
         # order is important (means priority of attribute).
-        if self._ki[k][KIFIN]:
+        if ki & KIFIN:
             return True
-        if self._ki[k][KITMP]:
+        if ki & KITMP:
             return False
-        return not self._ki[k][_KIWR]
+        return not ki & _KIWR
 
     def set_ki(self, k, attr, boolv):
-        self._ki[k][attr] = boolv
+        """
+        :param attr: (int) key info attribute - KIXXX. Several attributes
+                     can be OR-ed.
+        """
+        if boolv:
+            self._ki[k] |= attr
+        else:
+            self._ki[k] &= ~attr
 
     def is_ki_set(self, k, attr):
         return (k in self
-                and self._ki[k][attr])
+                and 0 != self._ki[k] & attr)
 
     def clear_temp_keys(self, recursive=False):
-        ks = self.keys()[:]
+        ks = list(self)
         for k in ks:
             if (recursive
-                    and isinstance(self[k], Sect)):
+                    and isinstance(self.get_raw(k), Sect)):
                 self[k].clear_temp_keys(True)
             if self.is_ki_set(k, KITMP):
                 del self[k]
 
     def is_section(self, k):
         return (k in self
-                and isinstance(self[k], Sect))
+                and isinstance(self.get_raw(k), Sect))
 
     def overlay_key_parseinfo(self, k, pi):
         """
@@ -183,8 +285,14 @@ class Sect(OrderedDict):
         :return:
         """
         assert k in self
-        # last element of list is final information couplied with key value.
-        self._ki[k][_KIPIH].add_overlay_pi(pi)
+        if not self.track_pi:
+            self._pih[k] = pi
+            return
+        pih = self._pih.get(k)
+        if None is not pih:
+            # last element of list is final information couplied with key
+            # value.
+            pih.add_overlay_pi(pi)
 
     def get_key_parseinfo_history(self, k):
         """
@@ -192,21 +300,160 @@ class Sect(OrderedDict):
         :return: list[(ParseInfoHistory)]
         """
         assert k in self
-        return self._ki[k][_KIPIH]
+        pih = self._pih.get(k)
+        if isinstance(pih, ParseInfo):
+            # Copy of the last one. Tag of it may be set for error.
+            pi = pih
+            pih = ParseInfoHistory()
+            pih.add_overlay_pi(ParseInfo(pi.stk, pi.src, pi.loc, pi.sp,
+                                         pi.tag))
+        # Empty history if parse info is not tracked.
+        return ParseInfoHistory() if None is pih else pih
+
+    def replace_parseinfo(self, fn):
+        """
+        Replace parse info of all keys - recursively - with fn(pi).
+        :param fn: function(ParseInfo) -> ParseInfo
+        """
+        for k in self:
+            pih = self._pih.get(k)
+            if isinstance(pih, ParseInfo):
+                self._pih[k] = fn(pih)
+            elif None is not pih:
+                pih.pis = [fn(pi) for pi in pih.pis]
+            if isinstance(self.get_raw(k), Sect):
+                self[k].replace_parseinfo(fn)
+
+    def clear_parseinfo(self):
+        """
+        Release the last parse info of keys kept while loading, of sections
+        whose 'track_pi' is False - recursively.
+        """
+        if not self.track_pi:
+            self._pih = {}
+        for k in self:
+            v = self.get_raw(k)
+            if isinstance(v, Sect):
+                v.clear_parseinfo()
+
+    def _kp_index(self):
+        """
+        Flat index of all keys under this section. It is built when it is
+        used first time, and then it is updated whenever sections under
+        this section are changed.
+        :return: dict - key path -> tuple(parent section, key)
+        """
+        kpi = self._kpidx
+        if None is kpi:
+            kpi = self._kpidx = _KPIndex()
+            Sect._kp_add(kpi, self, '')
+        return kpi.idx
+
+    @staticmethod
+    def _kp_add(kpi, s, prefix):
+        """
+        Add keys under section 's' to key path index, and register the index
+        to sections to be updated.
+        """
+        if None is s._kprefs:
+            s._kprefs = []
+        s._kprefs.append((kpi, prefix))
+        idx = kpi.idx
+        for k in s:
+            idx[prefix + k] = (s, k)
+            v = s.get_raw(k)
+            if isinstance(v, Sect):
+                Sect._kp_add(kpi, v, prefix + k + KP_DELIMITER)
+
+    @staticmethod
+    def _kp_remove(kpi, s, prefix):
+        """
+        Reverse of '_kp_add'.
+        """
+        s._kprefs.remove((kpi, prefix))
+        if not s._kprefs:
+            s._kprefs = None
+        idx = kpi.idx
+        for k in s:
+            idx.pop(prefix + k, None)
+            v = s.get_raw(k)
+            if isinstance(v, Sect):
+                Sect._kp_remove(kpi, v, prefix + k + KP_DELIMITER)
+
+    def _kp_set(self, k, v):
+        """
+        Update key path indexes having this section, before value of key 'k'
+        is replaced with 'v'.
+        """
+        old = dict.get(self, k)
+        for kpi, prefix in self._kprefs[:]:
+            kp = prefix + k
+            if isinstance(old, Sect):
+                Sect._kp_remove(kpi, old, kp + KP_DELIMITER)
+            kpi.idx[kp] = (self, k)
+            if isinstance(v, Sect):
+                Sect._kp_add(kpi, v, kp + KP_DELIMITER)
+
+    def _kp_del(self, k):
+        """
+        Update key path indexes having this section, before key 'k' is
+        removed.
+        """
+        old = dict.get(self, k)
+        for kpi, prefix in self._kprefs[:]:
+            kp = prefix + k
+            if isinstance(old, Sect):
+                Sect._kp_remove(kpi, old, kp + KP_DELIMITER)
+            kpi.idx.pop(kp, None)
+
+    def clear_path_index(self):
+        """
+        Release key path index to save memory. It is built again when it is
+        used.
+        """
+        kpi = self._kpidx
+        if None is not kpi:
+            self._kpidx = None
+            Sect._kp_remove(kpi, self, '')
+
+    def find_path(self, kpath):
+        """
+        :param kpath: (str) key path relative to this section. ex. 'a:b:c'
+        :return: tuple(parent section, key) of key at 'kpath'. KeyError is
+                 raised if there is no key.
+        """
+        return self._kp_index()[kpath]
+
+    def get_path(self, kpath, d=_NOKEY):
+        """
+        Get key value at key path with key path index, instead of walking
+        sections one level at a time.
+        :param kpath: (str) key path relative to this section. ex. 'a:b:c'
+        :param d: default value if there is no key. KeyError is raised if
+                  it is not given.
+        """
+        try:
+            s, k = self._kp_index()[kpath]
+        except KeyError:
+            if d is _NOKEY:
+                raise KeyError(kpath)
+            return d
+        return s[k]
 
     def scopy(self):
-        news = Sect(self.name)
+        news = Sect(self.name, self.track_pi)
         news.supdate(self)
         return news
 
     def kupdate(self, k, other):
-        if isinstance(other[k], Sect):
-            P.d('Sect(%s) is copied' % other[k].name)
-            self[k] = other[k].scopy()
+        v = other.get_raw(k)
+        if isinstance(v, Sect):
+            P.d('Sect(%s) is copied' % v.name)
+            self[k] = v.scopy()
         else:
-            self[k] = other[k]
-        # noinspection PyProtectedMember
-        self._overlay_ki(k, other._ki[k])
+            # LazyValue is shared. So, it is evaluated only once.
+            self[k] = v
+        self._overlay_ki(k, other)
 
     def supdate(self, s):
         for k in s:
@@ -217,8 +464,8 @@ class Sect(OrderedDict):
             #
             # Type of key value should be same.
             if k in self:
-                if (isinstance(self[k], Sect)
-                        and isinstance(s[k], Sect)):
+                if (isinstance(self.get_raw(k), Sect)
+                        and isinstance(s.get_raw(k), Sect)):
                     # if this is section key, merge subsection
                     if self.is_readonly(k):
                         raise KeyError('Section(%s) is not writable.'
@@ -231,7 +478,59 @@ class Sect(OrderedDict):
             else:
                 self.kupdate(k, s)
         # noinspection PyProtectedMember
-        self._ki.update(s._ki)
+        for k in s._ki:
+            # Key info of 's' should not be shared.
+            self._copy_ki(k, s)
+
+    def sdiff(self, other):
+        """
+        Compare key values with other section recursively.
+        Added or removed section is reported as it's path (keys in it are
+        not reported).
+        :param other: (Sect) section to compare with (new one).
+        :return: tuple(added, removed, changed). Each is list of key paths
+                 (ex. 'a:b:c') relative to this section.
+        """
+        added = []
+        removed = []
+        changed = []
+        Sect._sdiff(self, other, '', added, removed, changed)
+        return added, removed, changed
+
+    @staticmethod
+    def _sdiff(s0, s1, prefix, added, removed, changed):
+        for k in s0:
+            kp = prefix + k
+            if k not in s1:
+                removed.append(kp)
+                continue
+            v0 = s0[k]
+            v1 = s1[k]
+            if v0 is v1:
+                continue
+            v0sect = isinstance(v0, Sect)
+            if v0sect != isinstance(v1, Sect):
+                changed.append(kp)
+            elif not v0sect:
+                if v0 != v1:
+                    changed.append(kp)
+            elif v0 != v1:
+                # Comparing(in C) is much faster than walking same subtree.
+                Sect._sdiff(v0, v1, kp + KP_DELIMITER,
+                            added, removed, changed)
+        for k in s1:
+            if k not in s0:
+                added.append(prefix + k)
+
+    def evaluate_all(self):
+        """
+        Evaluate all LazyValues recursively.
+        Errors of evaluation - ex. errors.EvalError - are raised here.
+        """
+        for k in self:
+            v = self[k]
+            if isinstance(v, Sect):
+                v.evaluate_all()
 
     def to_dict(self):
         d = dict()
@@ -242,6 +541,107 @@ class Sect(OrderedDict):
                 d[k] = self[k]
         return d
 
+    def freeze(self):
+        """
+        Get immutable and hashable snapshot of this section recursively.
+        LazyValues are evaluated, and list and set key values are converted
+        to tuple and frozenset. 'scopy' of snapshot is mutable section.
+        :return: (FrozenSect)
+        """
+        return FrozenSect(self)
+
+
+def _frozen_value(v):
+    if isinstance(v, (list, tuple)):
+        return tuple([_frozen_value(e) for e in v])
+    if isinstance(v, set):
+        return frozenset(v)
+    return v
+
+
+class FrozenSect(Sect):
+    """
+    Immutable section. It can be shared among threads without locks and
+    copies. Hash and 'to_dict' result are cached.
+    Hash is available only if all key values are hashable.
+    """
+    def __init__(self, sect):
+        """
+        :param sect: (Sect) section to freeze.
+        """
+        Sect.__init__(self, sect.name, sect.track_pi)
+        for k in sect:
+            v = sect[k]
+            if isinstance(v, Sect):
+                v = v.freeze()
+            else:
+                v = _frozen_value(v)
+            OrderedDict.__setitem__(self, k, v)
+            self._copy_ki(k, sect)
+        self._hash = None
+        self._dict = None
+
+    def __setstate__(self, state):
+        Sect.__setstate__(self, state)
+        # Hash of str may be different at other process.
+        self._hash = None
+
+    def __getitem__(self, k):
+        # Key values are already evaluated.
+        return dict.__getitem__(self, k)
+
+    def __eq__(self, y):
+        # Frozen one is equal to mutable one having same key values.
+        return isinstance(y, Sect) and OrderedDict.__eq__(y, self)
+
+    def __hash__(self):
+        if None is self._hash:
+            self._hash = hash(tuple(self.items()))
+        return self._hash
+
+    def _immutable(self, *args, **kwargs):
+        raise TypeError('FrozenSect(%s) is immutable' % self.name)
+
+    __setitem__ = __delitem__ = force_setitem = _immutable
+    clear = pop = popitem = setdefault = update = _immutable
+    set_ki = _setro = _setrw = clear_temp_keys = _immutable
+    overlay_key_parseinfo = replace_parseinfo = clear_parseinfo = _immutable
+    kupdate = supdate = __ior__ = _immutable
+
+    def is_readonly(self, k):
+        return k in self
+
+    def freeze(self):
+        return self
+
+    def _kp_index(self):
+        # Immutable. So, index is never out of date, and it is not
+        # registered to sections to be updated.
+        if None is self._kpidx:
+            kpi = _KPIndex()
+            FrozenSect._kp_build(kpi.idx, self, '')
+            self._kpidx = kpi
+        return self._kpidx.idx
+
+    @staticmethod
+    def _kp_build(idx, s, prefix):
+        for k in s:
+            idx[prefix + k] = (s, k)
+            v = s.get_raw(k)
+            if isinstance(v, Sect):
+                FrozenSect._kp_build(idx, v, prefix + k + KP_DELIMITER)
+
+    def clear_path_index(self):
+        self._kpidx = None
+
+    def to_dict(self):
+        """
+        Returned dict is cached and shared. So, DO NOT modify it.
+        """
+        if None is self._dict:
+            self._dict = Sect.to_dict(self)
+        return self._dict
+
 
 # ============================================================================
 #
@@ -303,5 +703,97 @@ def test():
     d = s0.to_dict()
     print(d)
 
+    s3 = s2.scopy()
+    s3.set_writable()
+    s3['1'] = 'changed'
+    s3['sec00']['sec000']['3'] = 3
+    del s3['sec00']['a']
+    del s3['sec10']
+    s3['sec00']['2'] = Sect('2')
+    assert ((['sec00:sec000:3'], ['sec00:a', 'sec10'], ['1', 'sec00:2'])
+            == s2.sdiff(s3))
+    assert ([], [], []) == s2.sdiff(s2.scopy())
+
+    assert 3 == s3.get_path('sec00:sec000:3')
+    assert s3['sec00'] is s3.get_path('sec00')
+    assert None is s3.get_path('sec10:1', None)
+    s3['sec00']['sec000']['4'] = 4
+    del s3['sec00']['sec000']['3']
+    assert 4 == s3.get_path('sec00:sec000:4')
+    assert None is s3.get_path('sec00:sec000:3', None)
+    assert (s3['sec00'], '2') == s3.find_path('sec00:2')
+    try:
+        s3.get_path('sec00:2:x')
+        assert False
+    except KeyError:
+        pass
+
+    # Key path index is updated whenever sections under it are changed.
+    def build_index(s):
+        idx = {}
+        FrozenSect._kp_build(idx, s, '')
+        return idx
+
+    s5 = s3.scopy()
+    s5.set_writable()
+    assert 4 == s5.get_path('sec00:sec000:4')
+    kpi = s5._kpidx
+    sn = Sect('secn')
+    sn['x'] = 'X'
+    s5['sec00']['2'] = sn
+    sn['y'] = 'Y'
+    assert 'Y' == s5.get_path('sec00:2:y')
+    assert 'X' == sn.get_path('x')
+    s5['sec00']['sec000'].force_setitem('4', Sect('4'))
+    s5['sec00']['sec000']['4']['z'] = 'Z'
+    assert 'Z' == s5.get_path('sec00:sec000:4:z')
+    assert build_index(s5) == s5._kp_index()
+    sec000 = s5['sec00']['sec000']
+    del s5['sec00']['sec000']
+    sec000['5'] = 5
+    assert None is s5.get_path('sec00:sec000:5', None)
+    assert None is s5.get_path('sec00:sec000', None)
+    su = Sect('sec00')
+    su['sub'] = Sect('sub')
+    su['sub']['w'] = 'W'
+    s5['sec00'].supdate(su)
+    assert 'W' == s5.get_path('sec00:sub:w')
+    assert build_index(s5) == s5._kp_index()
+    s5['sec00'].clear()
+    assert kpi is s5._kpidx and build_index(s5) == s5._kp_index()
+    # 'sn' has its own index only.
+    assert [(sn._kpidx, '')] == sn._kprefs
+    s5.clear_path_index()
+    sn.clear_path_index()
+    assert None is s5._kprefs and None is s5['sec00']._kprefs
+    assert None is sn._kprefs and None is sn._kpidx
+    import pickle
+    s4 = pickle.loads(pickle.dumps(s3, pickle.HIGHEST_PROTOCOL))
+    assert None is s4._kpidx and 4 == s4.get_path('sec00:sec000:4')
+
+    import operator
+    f3 = s3.freeze()
+    assert s3 == f3 and f3 == s3 and hash(f3) == hash(s3.freeze())
+    s3['l'] = [1, [2]]
+    f3 = s3.freeze()
+    assert f3 is f3.freeze()
+    assert (1, (2,)) == f3['l']
+    assert hash(f3) == hash(s3.freeze())
+    assert f3.to_dict() is f3.to_dict()
+    assert f3.is_readonly('1')
+    for fn in (lambda: f3.__setitem__('1', 1),
+               lambda: f3['sec00'].__delitem__('1'),
+               lambda: operator.ior(f3, {'1': 1}),
+               lambda: f3.set_writable()):
+        try:
+            fn()
+            assert False
+        except TypeError:
+            pass
+    s4 = f3.scopy()
+    assert not isinstance(s4['sec00'], FrozenSect)
+    s4.set_writable()
+    s4['1'] = 1
+
 if '__main__' == __name__:
     test()
@@ -0,0 +1,285 @@
+################################################################################
+# Copyright (C) 2016, 2017
+# Younghyung Cho. <yhcting77@gmail.com>
+# All rights reserved.
+#
+# This file is part of cfgldr in ypylib
+#
+# This program is licensed under the FreeBSD license
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+# The views and conclusions contained in the software and documentation
+# are those of the authors and should not be interpreted as representing
+# official policies, either expressed or implied, of the FreeBSD Project.
+################################################################################
+
+
+#
+# Streaming(SAX-style) event API over config files.
+#
+# Config file is scanned entry by entry with the line-oriented grammar of
+# 'parser', and events are yielded without building section tree. Key
+# values are neither evaluated nor verified. Only contents of files being
+# scanned - one file for each include level - are kept in memory.
+#
+# Events are tuples whose first element is event type.
+#   (FILE_ENTER, file path)
+#   (FILE_EXIT, file path)
+#   (SECTION_ENTER, name, depth, position)
+#   (SECTION_EXIT, name, depth)
+#   (KEY, name, op, raw value, key info flags, position)
+#   (COMMAND, name, argument, position)
+# 'position' is (parseinfo.ConfPos), and 'key info flags' are OR-ed
+# section.KIXXX of key prefixes. Section depth is relative to the file
+# having the section. Included file is scanned just after COMMAND event
+# of 'include'-like command, if it is followed.
+#
+from __future__ import print_function
+import os.path
+
+import deps as depsmod
+import lineparser
+import parser
+from parseinfo import ConfPos, Source, ParseInfo
+from errors import ParseError, FileIOError
+
+# Event types
+FILE_ENTER = 'file_enter'
+FILE_EXIT = 'file_exit'
+SECTION_ENTER = 'section_enter'
+SECTION_EXIT = 'section_exit'
+KEY = 'key'
+COMMAND = 'command'
+
+# Commands including other config files.
+_INCLUDE_CMDS = ('include', 'inherit')
+
+
+class _FileCtx(object):
+    __slots__ = ('src', 'loc', 'sects')
+
+    def __init__(self, fconf):
+        self.src = Source(fconf, '')
+        self.loc = -1  # location of item being handled
+        self.sects = []  # names of open sections
+
+
+class _Scanner(object):
+    def __init__(self, confdict, follow_include):
+        self.confdict = confdict
+        self.follow_include = follow_include
+        self.ctxs = []  # list(_FileCtx) include stack
+        # Parse actions are generators of events.
+        wordrestr, keyrestr = parser._word_key_restr(False)
+        self.psr = lineparser.LineParser(wordrestr, keyrestr,
+                                         parser._KICMD_CH,
+                                         self._sect_events,
+                                         self._cmd_events,
+                                         self._keyvalue_events)
+
+    def _parseinfo(self, loc, tag):
+        c = self.ctxs[-1]
+        stk = tuple([(x.src, x.loc) for x in self.ctxs[:-1]])
+        sp = tuple([name for x in self.ctxs for name in x.sects])
+        return ParseInfo(stk, c.src, loc, sp, tag)
+
+    def _pos(self, loc):
+        src = self.ctxs[-1].src
+        return ConfPos(src.file, src.ps, loc)
+
+    def _sect_events(self, ps, loc, toks):
+        (sect_s, name, sect_e) = toks
+        sects = self.ctxs[-1].sects
+        depth = len(sect_s)
+        if depth != len(sect_e):
+            raise ParseError(self._parseinfo(loc, 'Incorrect section depth'))
+        if depth > len(sects) + 1:
+            raise ParseError(self._parseinfo(loc, 'Section too nested'))
+        while len(sects) >= depth:
+            yield SECTION_EXIT, sects.pop(), len(sects) + 1
+        sects.append(name)
+        yield SECTION_ENTER, name, depth, self._pos(loc)
+
+    def _keyvalue_events(self, ps, loc, toks):
+        k, kis = parser._split_key_prefix(toks[0])
+        v = toks[2] if 3 == len(toks) else ''
+        yield KEY, k, toks[1], v, kis, self._pos(loc)
+
+    def _cmd_events(self, ps, loc, toks):
+        cmd = toks[0].strip()
+        arg = toks[1].strip()
+        yield COMMAND, cmd, arg, self._pos(loc)
+        if (not self.follow_include
+                or cmd not in _INCLUDE_CMDS):
+            return
+        if parser._is_abspath(arg):
+            pathvalue = arg
+        else:
+            pathvalue = os.path.join(
+                os.path.dirname(self.ctxs[-1].src.file), arg)
+        files = depsmod.glob_files(pathvalue)
+        if 0 == len(files):
+            raise FileIOError(self._parseinfo(loc,
+                                              'Fail to access config file'))
+        for f in files:
+            for ev in self.scan(f):
+                yield ev
+
+    def scan(self, fconf):
+        """
+        :param fconf: (str) abs-path of config file
+        """
+        for c in self.ctxs:
+            if c.src.file == fconf:
+                raise ParseError(self._parseinfo(
+                    self.ctxs[-1].loc,
+                    'Cyclic(Recursive) parsing is detected'))
+        c = _FileCtx(fconf)
+        self.ctxs.append(c)
+        try:
+            try:
+                with open(fconf, 'rb') as f:
+                    content = f.read()
+            except IOError:
+                raise FileIOError(self._parseinfo(
+                    -1, 'Fail to access config file'))
+            # noinspection PyUnresolvedReferences
+            content = str(content.decode('utf-8'))
+            if None is not self.confdict:
+                try:
+                    content = content % self.confdict
+                except KeyError as e:
+                    raise ParseError(self._parseinfo(
+                        0, 'Unknown symbol at named-replacement: %%(%s)s'
+                           % str(e)))
+            # Locations are ones at tab-expanded string like 'parser'.
+            c.src = Source(fconf, content.expandtabs())
+            yield FILE_ENTER, fconf
+            try:
+                for action, loc, toks in self.psr.iterparse(c.src.ps):
+                    c.loc = loc
+                    for ev in action(c.src.ps, loc, toks):
+                        yield ev
+            except lineparser.LineParseError as e:
+                raise ParseError(self._parseinfo(e.loc, e.msg))
+            while c.sects:
+                yield SECTION_EXIT, c.sects.pop(), len(c.sects) + 1
+            yield FILE_EXIT, fconf
+        finally:
+            self.ctxs.pop()
+
+
+def iterparse(fconf, confdict=None, follow_include=False):
+    """
+    Scan config file and yield events one by one. See comments at the top
+    of this module for events.
+    Errors are same with the ones of 'parser.parse_conf', and raised when
+    erroneous entry is reached.
+    :param fconf: (str) config file path
+    :param confdict: (dict) named-replacement-dict for config
+    :param follow_include: (bool) True to scan files of 'include'-like
+                           commands, in place.
+    :return: generator of events
+    """
+    return _Scanner(confdict, follow_include).scan(os.path.abspath(fconf))
+
+
+# ============================================================================
+#
+#
+#
+# ============================================================================
+def test():
+    import shutil
+    import tempfile
+    from section import KIFIN, KITMP
+    from errors import BaseError
+
+    tmpd = tempfile.mkdtemp()
+    try:
+        fconf = os.path.join(tmpd, 'conf')
+        finc = os.path.join(tmpd, 'inc')
+        with open(fconf, 'w') as f:
+            f.write('k0 = %(v)s\n'
+                    '[ s0 ]\n'
+                    '    !k1 := "a b"  # comment\n'
+                    '    [[ s1 ]]\n'
+                    '        @include (inc)\n'
+                    '[ s2 ]\n'
+                    '    ~k2 =\n')
+        with open(finc, 'w') as f:
+            f.write('[ i0 ]\n    k3 = {*:k0}\n')
+
+        evs = list(iterparse(fconf, {'v': 'V'}))
+        assert ([FILE_ENTER, KEY, SECTION_ENTER, KEY, SECTION_ENTER,
+                 COMMAND, SECTION_EXIT, SECTION_EXIT, SECTION_ENTER, KEY,
+                 SECTION_EXIT, FILE_EXIT]
+                == [e[0] for e in evs])
+        assert ('k0', '=', 'V', 0) == evs[1][1:5]
+        assert ('k1', ':=', 'a b', KIFIN) == evs[3][1:5]
+        assert 3 == evs[3][5].lineno
+        assert ('s1', 2) == evs[4][1:3] and ('s1', 2) == evs[6][1:]
+        assert ('include', 'inc') == evs[5][1:3]
+        assert ('k2', '=', '', KITMP) == evs[9][1:5]
+
+        evs = list(iterparse(fconf, {'v': 'V'}, True))
+        assert ([COMMAND, FILE_ENTER, SECTION_ENTER, KEY, SECTION_EXIT,
+                 FILE_EXIT, SECTION_EXIT]
+                == [e[0] for e in evs[5:12]])
+        assert finc == evs[6][1] and ('k3', '=', '{*:k0}') == evs[8][1:4]
+
+        # Errors are reported with include back trace.
+        with open(finc, 'w') as f:
+            f.write('[[ i0 ]]\n')
+        try:
+            list(iterparse(fconf, {'v': 'V'}, True))
+            assert False
+        except ParseError as e:
+            assert 'Section too nested' == e.pi.tag
+            assert fconf == e.pi.stk[0][0].file
+        with open(finc, 'w') as f:
+            f.write('@include (conf)\n')
+        for fn in (lambda: list(iterparse(fconf, {'v': 'V'}, True)),
+                   lambda: list(iterparse(fconf, {})),
+                   lambda: list(iterparse(os.path.join(tmpd, 'nofile')))):
+            try:
+                fn()
+                assert False
+            except BaseError:
+                pass
+
+        # Same syntax with 'parser'.
+        for name in sorted(os.listdir('tests')):
+            if not name.endswith('.ok'):
+                continue
+            fpath = os.path.join('tests', name[:-len('.ok')])
+            confdict = {'__filename__': os.path.basename(fpath)}
+            for _ in iterparse(fpath, confdict, True):
+                pass
+    finally:
+        shutil.rmtree(tmpd)
+
+
+if '__main__' == __name__:
+    test()
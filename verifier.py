@@ -38,6 +38,15 @@
 import logger
 import section
 import re
+import uuid
+try:
+    from collections.abc import Mapping
+except ImportError:
+    from collections import Mapping
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
 from section import Sect
 from errors import VerificationError, VerificationFailException
 from parseinfo import ParseInfo
@@ -102,82 +111,379 @@ def _generate_default_verifier_dict():
 
 # ============================================================================
 #
+# Config view used as 'CNF' at verifier
 #
+# ============================================================================
+class _ConfView(Mapping):
+    """
+    Read-only view of config section.
+    Values can be accessed as attributes too - ex. CNF.key0
+    """
+    def __init__(self, sect):
+        self._sect = sect
+
+    def __getitem__(self, k):
+        v = self._sect[k]
+        return _ConfView(v) if isinstance(v, Sect) else v
+
+    def __getattr__(self, k):
+        try:
+            return self[k]
+        except KeyError:
+            raise AttributeError(k)
+
+    def __iter__(self):
+        return iter(self._sect)
+
+    def __len__(self):
+        return len(self._sect)
+
+    def __contains__(self, k):
+        return k in self._sect
+
+    def __repr__(self):
+        return repr(self._sect)
+
+
+# ============================================================================
+#
+# Compiled verifier
 #
 # ============================================================================
-def _match_keyrule(k, rule):
-    return None is not re.match('^' + rule + '$', k)
+# Key rule matching only same string.
+_LITERAL_KEYRULE_RE = re.compile(r'[a-zA-Z0-9_\-]+\Z')
+# Inline flags(ex. '(?i)') affects whole regex.
+_INLINE_FLAGS_RE = re.compile(r'\(\?[aiLmsux]+\)')
+# Python2 supports at most 100 groups in one regex.
+_MAX_RULES_PER_RE = 90
+
+
+class _Rule(object):
+    def __init__(self, vsct, vk, index):
+        """
+        :param vsct: (Sect) verifier section having rule.
+        :param vk: (str) key of rule. This is regex for config key.
+        :param index: (int) order of rule in section.
+        """
+        self.key = vk
+        self.index = index
+        self.pih = vsct.get_key_parseinfo_history(vk)
+        self.mandatory = vsct.is_ki_set(vk, section.KIMAN)
+        # Errors of compiling are raised when rule is used - like 'eval'.
+        try:
+            self.keyre = re.compile('^' + vk + '$')
+        except re.error as e:
+            self.keyre = e
+        vv = vsct[vk]
+        self.src = vv
+        self.is_sect = isinstance(vv, Sect)
+        if self.is_sect:
+            self.value = _RuleSect(vv)
+        else:
+            try:
+                # Same file name with the one used by 'eval'.
+                self.value = compile(vv, '<string>', 'eval')
+            except BaseException as e:
+                self.value = e
+
+    def match_key(self, k):
+        if isinstance(self.keyre, BaseException):
+            raise self.keyre
+        return None is not self.keyre.match(k)
+
+    def is_combinable(self):
+        """
+        :return: (bool) True if key regex can be a part of bigger regex.
+        """
+        return (not isinstance(self.keyre, BaseException)
+                and 0 == self.keyre.groups
+                and None is _INLINE_FLAGS_RE.search(self.key))
+
+
+class _RegexRules(object):
+    """Key regexes of rules combined into one regex."""
+    def __init__(self, rules):
+        self.first = rules[0].index
+        self.rules = {}
+        alts = []
+        for r in rules:
+            gname = 'r%d' % len(alts)
+            self.rules[gname] = r
+            alts.append('(?P<%s>^%s$)' % (gname, r.key))
+        self.regex = re.compile('|'.join(alts))
+
+    def match(self, k):
+        m = self.regex.match(k)
+        return None if None is m else self.rules[m.lastgroup]
+
+
+class _SingleRule(object):
+    def __init__(self, rule):
+        self.first = rule.index
+        self.rule = rule
+
+    def match(self, k):
+        return self.rule if self.rule.match_key(k) else None
+
+
+class _RuleIndex(object):
+    """
+    Find first rule matching key.
+    Literal rules are found by dict lookup. Others are combined into
+    regexes with keeping order of rules.
+    """
+    def __init__(self, rules):
+        self.literals = {}
+        self.matchers = []
+        pending = []
+        for r in rules:
+            if (r.is_combinable()
+                    and None is not _LITERAL_KEYRULE_RE.match(r.key)):
+                self.literals.setdefault(r.key, r)
+                continue
+            if r.is_combinable():
+                pending.append(r)
+                if len(pending) >= _MAX_RULES_PER_RE:
+                    self._flush(pending)
+                continue
+            self._flush(pending)
+            self.matchers.append(_SingleRule(r))
+        self._flush(pending)
+
+    def _flush(self, pending):
+        if 0 == len(pending):
+            return
+        try:
+            self.matchers.append(_RegexRules(pending))
+        except re.error:
+            self.matchers.extend([_SingleRule(r) for r in pending])
+        del pending[:]
+
+    def find(self, k):
+        """
+        :return: (_Rule) first rule matching key. None if there is no rule.
+        """
+        lr = self.literals.get(k)
+        for m in self.matchers:
+            if (None is not lr
+                    and m.first > lr.index):
+                break
+            r = m.match(k)
+            if None is not r:
+                return (r if None is lr or r.index < lr.index
+                        else lr)
+        return lr
+
+
+class _RuleSect(object):
+    def __init__(self, vsct):
+        self.rules = [_Rule(vsct, vk, i) for i, vk in enumerate(vsct)]
+        # Rule whose key regex is wrong should be tried for any type.
+        # - Error is raised like before compiling.
+        self.index = {}
+        for is_sect in (True, False):
+            self.index[is_sect] = _RuleIndex(
+                [r for r in self.rules
+                 if (r.is_sect == is_sect
+                     or isinstance(r.keyre, BaseException))])
+
+
+class Verifier(object):
+    """
+    Verifier whose rules are compiled once.
+    It can be used to verify any number of configs.
+    """
+    def __init__(self, vsct, vfconf, vrf_ruledict=None, deps=None):
+        """
+        :param vsct: (Sect) root section of verifier
+        :param vfconf: (str) verifier file path
+        :param vrf_ruledict: (dict) Custom functions to be used at verifier.
+                             This is used as global dict to eval verifier rule.
+        :param deps: (deps.Deps) files read while parsing verifier.
+        """
+        self.sroot = vsct
+        self.file = vfconf
+        self.ruledict = {} if None is vrf_ruledict else vrf_ruledict
+        self.deps = deps
+        # Identifies verifier at worker processes. See '_load_verifier'.
+        self.id = uuid.uuid4().hex
+        self._rsct = _RuleSect(vsct)
+
+    def __getstate__(self):
+        # Compiled code cannot be pickled.
+        state = dict(self.__dict__)
+        del state['_rsct']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._rsct = _RuleSect(self.sroot)
+
+    def _create_evaldict(self):
+        rule_eval_dict = _generate_default_verifier_dict()
+        # Override with custome rule dictionary
+        rule_eval_dict.update(self.ruledict)
+        return rule_eval_dict
+
+    def verify(self, csct, cfconf='', pool=None):
+        """
+        :param csct: (Sect) root section of config
+        :param cfconf: (str) config file path. This is used only at error
+                       messages.
+        :param pool: (multiprocessing.pool.Pool or ThreadPool) If it is not
+                     None, top-level subsections are verified in parallel
+                     with it. Error raised is same with the one of
+                     sequential verification. With process pool, verifier
+                     (including custom rule dictionary) should be able to
+                     be pickled.
+        :raise: errors.VerificationError
+        """
+        cspih = ParseInfo.create_dummy_parseinfo(cfconf)
+        vspih = ParseInfo.create_dummy_parseinfo(self.file)
+        evaldict = self._create_evaldict()
+        if None is pool:
+            _verify_sect(csct, cspih, self._rsct, vspih, evaldict)
+            return
+        tasks = {}
+        vh = _VerifierHandle(self)
+        for ck in csct:
+            if not csct.is_section(ck):
+                continue
+            try:
+                r = self._rsct.index[True].find(ck)
+                # Values are evaluated before being passed to other
+                # process. If it fails, subsection is verified in
+                # sequence to raise error at right time.
+                csct[ck].evaluate_all()
+            except Exception:
+                continue
+            if None is r:
+                continue
+            tasks[ck] = pool.apply_async(
+                _verify_subsect,
+                (vh, r.index, csct[ck],
+                 csct.get_key_parseinfo_history(ck)))
+        _verify_sect(csct, cspih, self._rsct, vspih, evaldict, tasks)
+
+
+# Verifiers used at this (worker) process. verifier id -> Verifier
+_verifiers = {}
+_MAX_VERIFIERS = 8
+
+
+def _load_verifier(vid, data):
+    """
+    Verifier from '_VerifierHandle' at worker process. Rules are compiled
+    only when verifier is used first time at the process.
+    :param vid: (str) verifier id
+    :param data: (bytes) pickled verifier
+    """
+    vrf = _verifiers.get(vid)
+    if None is vrf:
+        vrf = pickle.loads(data)
+        if len(_verifiers) >= _MAX_VERIFIERS:
+            _verifiers.clear()
+        _verifiers[vid] = vrf
+    return vrf
+
+
+class _VerifierHandle(object):
+    """
+    Verifier passed to tasks of pool. Verifier is pickled only once for
+    all tasks, and it is unpickled - rules are compiled - only once at
+    each worker process.
+    """
+    def __init__(self, vrf):
+        self.vrf = vrf
+        self._data = None
+
+    def __reduce__(self):
+        if None is self._data:
+            self._data = pickle.dumps(self.vrf, pickle.HIGHEST_PROTOCOL)
+        return _load_verifier, (self.vrf.id, self._data)
+
 
+def _verify_subsect(vrf, rindex, csct, cspih):
+    """
+    Task verifying subsection matched with top-level rule.
+    :param vrf: (Verifier or _VerifierHandle) verifier. Handle is passed
+                as it is at thread pool.
+    :param rindex: (int) index of rule at root section of verifier
+    """
+    if isinstance(vrf, _VerifierHandle):
+        vrf = vrf.vrf
+    r = vrf._rsct.rules[rindex]
+    _verify_sect(csct, cspih, r.value, r.pih, vrf._create_evaldict())
 
+
+# ============================================================================
+#
+#
+#
+# ============================================================================
 def _match_valrule(v, rule, evaldict, ckey, cpih, vkey, vpih):
     assert None is not v
     evaldict['VAL'] = v
     try:
+        if isinstance(rule, BaseException):
+            raise rule
         return eval(rule, {}, evaldict)
     except BaseException as e:
         raise VerificationError(ckey, cpih, vkey, vpih,
                                 'Verifier exception: %s' % str(e))
 
 
-def _verify_sect(csct, cspih, vsct, vspih, evaldict):
+def _verify_sect(csct, cspih, vrsct, vspih, evaldict, tasks=None):
     """
     :param csct: (Sect) root section of config
     :param cspih:
-    :param vsct: (Sect) root section of verifier
+    :param vrsct: (_RuleSect) compiled rules of verifier section
     :param vspih:
     :param evaldict: (dict) symbols to be used at verifier
+    :param tasks: (dict) key -> (AsyncResult) subsections being verified
+                  by other threads or processes.
     :return:
     """
     # Current configuration section can be referred by verifier.
-    evaldict['CNF'] = csct.to_dict()
+    cnf = _ConfView(csct)
 
     # check mandatory key
     mank = {}  # mandatory keys.
-    for vk in vsct:
-        if vsct.is_ki_set(vk, section.KIMAN):
-            mank[vk] = False
+    for r in vrsct.rules:
+        if r.mandatory:
+            mank[r.key] = False
 
-    # TODO: Any better way improving performance?
-    # This is O(n * m) naive and simple algorithm.
     for ck in csct:
-        mfound = False
         cpih = csct.get_key_parseinfo_history(ck)
-        for vk in vsct:
-            if not _match_keyrule(ck, vk):
-                continue
-            cv = csct[ck]
-            vv = vsct[vk]
-            # rule and config are different-type.
-            # than ignore this rule.
-            if isinstance(cv, Sect) != isinstance(vv, Sect):
-                continue
-
-            # key rule matches
-            if vk in mank:
-                # Mandatory is found.
-                mank[vk] = True
-
-            vpih = vsct.get_key_parseinfo_history(vk)
-            if isinstance(cv, Sect):
-                _verify_sect(cv, cpih, vv, vpih, evaldict)
-            elif not _match_valrule(cv, vv, evaldict,
-                                    ck, cpih, vk, vpih):
-                raise VerificationError(ck, cpih, vk, vpih,
-                                        'Rule-verification fails')
-            P.d('Matched: key(%s, %s), value(%s, %s)' %
-                (ck, vk, cv, vv))
-            # Rule matches. Move to next config key
-            mfound = True
-            break
-
-        if not mfound:
+        # Rules whose type is different from config are ignored.
+        is_sect = isinstance(csct.get_raw(ck), Sect)
+        r = vrsct.index[is_sect].find(ck)
+        if None is r:
             raise VerificationError(ck, cpih, '', vspih,
                                     'No-rule found')
-    for vk in mank:
-        if not mank[vk]:
-            vpih = vsct.get_key_parseinfo_history(vk)
+        cv = csct[ck]
+
+        # key rule matches
+        if r.key in mank:
+            # Mandatory is found.
+            mank[r.key] = True
+
+        evaldict['CNF'] = cnf
+        if None is not tasks and ck in tasks:
+            # Errors raised at task is raised here.
+            tasks[ck].get()
+        elif r.is_sect:
+            _verify_sect(cv, cpih, r.value, r.pih, evaldict)
+        elif not _match_valrule(cv, r.value, evaldict,
+                                ck, cpih, r.key, r.pih):
+            raise VerificationError(ck, cpih, r.key, r.pih,
+                                    'Rule-verification fails')
+        P.d('Matched: key(%s, %s), value(%s, %s)' %
+            (ck, r.key, cv, r.src))
+    for r in vrsct.rules:
+        if r.key in mank and not mank[r.key]:
             # Some mandatory key is NOT defined.
-            raise VerificationError('', cspih, vk, vpih,
+            raise VerificationError('', cspih, r.key, r.pih,
                                     'Missing mandatory key')
 
 
@@ -194,10 +500,4 @@ def verify_conf(csct, cfconf, vsct, vfconf, vrf_ruledict):
     if None is vsct:
         assert None is vfconf
         return  # nothing to do. Accept all.
-    rule_eval_dict = _generate_default_verifier_dict()
-
-    # Override with custome rule dictionary
-    rule_eval_dict.update(vrf_ruledict)
-    _verify_sect(csct, ParseInfo.create_dummy_parseinfo(cfconf),
-                 vsct, ParseInfo.create_dummy_parseinfo(vfconf),
-                 rule_eval_dict)
+    Verifier(vsct, vfconf, vrf_ruledict).verify(csct, cfconf)